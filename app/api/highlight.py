@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from typing import List, Optional
+from sqlmodel import Session
+import uuid
+import time
+import logging
+from app.database import get_session
+from app.highlight_service import highlight_index
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["highlight"])
+
+class HighlightRequest(BaseModel):
+    # Either the whole page text or a list of text chunks (e.g. one per DOM text node)
+    text: Optional[str] = None
+    chunks: List[str] = []
+
+class HighlightMatch(BaseModel):
+    chunk: int
+    start: int
+    end: int
+    word_id: uuid.UUID
+    word: str
+    learned: bool
+
+class HighlightResponse(BaseModel):
+    matches: List[HighlightMatch]
+
+@router.post("/highlight", response_model=HighlightResponse)
+def highlight(request: HighlightRequest, session: Session = Depends(get_session)):
+    """
+    Find saved words in page text.
+    Offsets are character positions within `text` (chunk 0) or within each chunk.
+    """
+    highlight_index.ensure_loaded(session)
+
+    chunks = [request.text] if request.text is not None else request.chunks
+
+    t0 = time.time()
+    matches = []
+    for chunk_index, chunk in enumerate(chunks):
+        for match in highlight_index.match(chunk):
+            matches.append(HighlightMatch(chunk=chunk_index, **match))
+    logger.info(f"Highlight matched {len(matches)} words in {sum(len(c) for c in chunks)} chars in {time.time() - t0:.4f}s")
+
+    return HighlightResponse(matches=matches)
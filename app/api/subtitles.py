@@ -0,0 +1,165 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, field_validator
+from typing import Dict, List
+from datetime import datetime
+from sqlmodel import Session
+import asyncio
+import json
+import logging
+from app.database import engine, get_session
+from app.gemini_service import translate_sentence
+from app.languages import DEFAULT_LANGUAGE, normalize_language, language_name
+from app.llm_scheduler import llm_priority, USER
+from app.models import SubtitleTrack
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/subtitles", tags=["subtitles"])
+
+# Cues are translated window by window, starting at the playback position
+LOOKAHEAD_WINDOW_SECONDS = 60
+
+class SubtitleCue(BaseModel):
+    start: float
+    end: float
+    text: str
+
+class SubtitleTrackRequest(BaseModel):
+    video_id: str
+    cues: List[SubtitleCue]
+    # Current playback position in seconds
+    position: float = 0
+    target_lang: str = DEFAULT_LANGUAGE
+
+    @field_validator("target_lang")
+    @classmethod
+    def check_target_lang(cls, value: str) -> str:
+        return normalize_language(value)
+
+def normalize_line(text: str) -> str:
+    return " ".join(text.split())
+
+def save_translations(video_id: str, target_lang: str, new_translations: Dict[str, str]):
+    """
+    Merge newly translated lines into the stored track.
+    """
+    with Session(engine) as session:
+        track = session.get(SubtitleTrack, (video_id, target_lang))
+        if not track:
+            track = SubtitleTrack(video_id=video_id, target_lang=target_lang)
+        merged = dict(track.translations or {})
+        merged.update(new_translations)
+        # Reassign so SQLAlchemy notices the JSON change
+        track.translations = merged
+        track.updated_at = datetime.now().timestamp()
+        session.add(track)
+        session.commit()
+
+@router.get("/{video_id}", response_model=SubtitleTrack)
+def get_subtitle_track(video_id: str, target_lang: str = DEFAULT_LANGUAGE, session: Session = Depends(get_session)):
+    """
+    Return the stored translations of a video's subtitle track.
+    """
+    try:
+        target_lang = normalize_language(target_lang)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    track = session.get(SubtitleTrack, (video_id, target_lang))
+    if not track:
+        raise HTTPException(status_code=404, detail="Subtitle track not found")
+    return track
+
+@router.post("/translate")
+async def translate_subtitles(request: SubtitleTrackRequest, session: Session = Depends(get_session)):
+    """
+    Translate a whole subtitle track.
+    Streams one NDJSON line per cue as soon as its translation is ready:
+    stored lines first, then the rest in look-ahead windows from `position`.
+    """
+    target_lang_name = language_name(request.target_lang)
+
+    track = session.get(SubtitleTrack, (request.video_id, request.target_lang))
+    stored = dict(track.translations) if track and track.translations else {}
+
+    # Repeated lines ("[Music]", "Yeah.") are translated once
+    cues_by_line: Dict[str, List[int]] = {}
+    for index, cue in enumerate(request.cues):
+        line = normalize_line(cue.text)
+        if line:
+            cues_by_line.setdefault(line, []).append(index)
+
+    cached_lines = [line for line in cues_by_line if line in stored]
+    pending_lines = [line for line in cues_by_line if line not in stored]
+
+    def next_start(line: str) -> float:
+        # Next time the line is shown, or its first showing if it won't come again
+        starts = [request.cues[index].start for index in cues_by_line[line]]
+        upcoming_starts = [start for start in starts if start >= request.position]
+        return min(upcoming_starts) if upcoming_starts else min(starts)
+
+    # Upcoming lines in playback order, lines already played last
+    upcoming = sorted((l for l in pending_lines if next_start(l) >= request.position), key=next_start)
+    played = sorted((l for l in pending_lines if next_start(l) < request.position), key=next_start)
+
+    windows: List[List[str]] = []
+    for line in upcoming:
+        window_index = int((next_start(line) - request.position) // LOOKAHEAD_WINDOW_SECONDS)
+        while len(windows) <= window_index:
+            windows.append([])
+        windows[window_index].append(line)
+    windows = [window for window in windows if window]
+    if played:
+        windows.append(played)
+
+    def cue_events(line: str, translation: str, cached: bool) -> str:
+        events = []
+        for index in cues_by_line[line]:
+            cue = request.cues[index]
+            events.append(json.dumps({
+                "index": index,
+                "start": cue.start,
+                "end": cue.end,
+                "text": cue.text,
+                "translation": translation,
+                "cached": cached
+            }, ensure_ascii=False) + "\n")
+        return "".join(events)
+
+    async def translate_line(line: str):
+        with llm_priority(USER):
+            return line, await translate_sentence(line, target_lang_name)
+
+    async def stream():
+        for line in sorted(cached_lines, key=lambda l: (next_start(l) < request.position, next_start(l))):
+            yield cue_events(line, stored[line], True)
+
+        translated = 0
+        for window in windows:
+            new_translations = {}
+            tasks = [asyncio.create_task(translate_line(line)) for line in window]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    line, translation = await next_done
+                    translated += 1
+                    # Failed lines come back untranslated, don't store them
+                    if translation and translation != line:
+                        new_translations[line] = translation
+                    yield cue_events(line, translation, False)
+            finally:
+                # The client went away (or a line failed): stop the lines still in flight
+                for task in tasks:
+                    task.cancel()
+
+            if new_translations:
+                try:
+                    await run_in_threadpool(save_translations, request.video_id, request.target_lang, new_translations)
+                except Exception as e:
+                    logger.error(f"Failed to store subtitle track {request.video_id}: {e}")
+
+        logger.info(f"Subtitle track {request.video_id}: {len(request.cues)} cues, "
+                    f"{len(cues_by_line)} unique lines, {len(cached_lines)} cached, {translated} translated")
+        yield json.dumps({"done": True, "cached": len(cached_lines), "translated": translated}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from typing import List
+from sqlmodel import Session
+from app.database import get_session
+from app.suggest_service import suggest_index, MAX_SUGGESTIONS
+
+router = APIRouter(tags=["suggest"])
+
+class Suggestion(BaseModel):
+    word: str
+    # In the user's word list
+    saved: bool
+    learned: bool
+
+class SuggestResponse(BaseModel):
+    prefix: str
+    suggestions: List[Suggestion]
+
+@router.get("/suggest", response_model=SuggestResponse)
+def suggest(
+    prefix: str,
+    limit: int = Query(10, ge=1, le=MAX_SUGGESTIONS),
+    session: Session = Depends(get_session)
+):
+    """
+    Autocomplete a word as the user types, from the in-memory prefix index.
+    """
+    suggest_index.ensure_loaded(session)
+    return SuggestResponse(prefix=prefix, suggestions=suggest_index.suggest(prefix, limit))
@@ -1,11 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, field_validator
 from typing import Optional, List, Dict, Any
 from sqlmodel import Session, select
+import json
 import logging
-from app.gemini_service import lookup_word, translate_sentence, is_single_word
-from app.database import get_session
+from app.gemini_service import (
+    lookup_word, stream_lookup_word, translate_sentence, is_single_word, extract_simple_translation, LookupFailed
+)
+from app.cache import cache, word_cache_key, WORD_TTL, FAILURE_TTL
+from app.database import engine, get_session
+from app.deadline import DeadlineExceeded, within, current_deadline
+from app.ecdict_service import resolve_lemma, fetch_ecdict_data
+from app.languages import DEFAULT_LANGUAGE, normalize_language, language_name
+from app.llm_service import llm_manager
 from app.models import Word
+from app.refresh_service import version_refresher, version_tag, current_version_tag
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +25,12 @@ router = APIRouter()
 
 class TranslateRequest(BaseModel):
     text: str
-    target_lang: str = "zh"
+    target_lang: str = DEFAULT_LANGUAGE
+
+    @field_validator("target_lang")
+    @classmethod
+    def check_target_lang(cls, value: str) -> str:
+        return normalize_language(value)
 
 class TranslateResponse(BaseModel):
     translation: str
@@ -24,20 +39,128 @@ class TranslateResponse(BaseModel):
     meanings: List[Dict[str, Any]] = []
     phonetics: List[Dict[str, Any]] = []
     detected_source_lang: Optional[str] = None
+    # Set when an inflected form was answered with its lemma ('running' -> 'run')
+    lemma: Optional[str] = None
+    # The request deadline ran out; this is the best answer available by then
+    partial: bool = False
+
+def word_payload(word: Word) -> Dict[str, Any]:
+    return {
+        "translation": word.translation,
+        "phonetic": word.phonetic,
+        "audio_url": word.audio_url,
+        "meanings": word.meanings if word.meanings else [],
+        "phonetics": word.phonetics if word.phonetics else [],
+        # Provider/model/prompt that produced the entry
+        "version": version_tag(word.provider, word.llm_model, word.prompt_version),
+    }
+
+async def find_cached_word(session: Session, text: str, target_lang: str) -> Optional[Dict[str, Any]]:
+    """
+    Look a word up in the shared cache, then in the Word table.
+    """
+    key = word_cache_key(text, target_lang)
+    cached = await cache.get(key)
+    if cached is not None:
+        # Served as is; entries from an older model or prompt are refreshed in the background
+        if cached.get("version") not in (None, current_version_tag()):
+            version_refresher.request(text, target_lang)
+        return cached
+
+    # Provisional rows are placeholders from failed lookups, not answers
+    statement = select(Word).where(
+        Word.original == text, Word.target_lang == target_lang, Word.provisional == False
+    )
+    cached_word = session.exec(statement).first()
+    if not cached_word:
+        return None
+
+    payload = word_payload(cached_word)
+    if payload["version"] not in (None, current_version_tag()):
+        version_refresher.request(text, target_lang)
+    await cache.set(key, payload, WORD_TTL)
+    return payload
+
+async def save_lookup_result(session: Session, lookup_text: str, target_lang: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store an LLM lookup result as an unstarred Word (or complete a
+    provisional one) and return its payload.
+    Storage failures are logged; the payload is returned either way.
+    """
+    payload = {
+        "translation": extract_simple_translation(data, lookup_text),
+        "phonetic": data.get("phonetic"),
+        "audio_url": None,
+        "meanings": data.get("meanings", []),
+        "phonetics": [],  # Structure different, omitting for now
+    }
+    try:
+        new_word = session.exec(
+            select(Word).where(
+                Word.original == lookup_text, Word.target_lang == target_lang, Word.provisional == True
+            )
+        ).first()
+        if new_word:
+            new_word.translation = payload["translation"]
+            new_word.phonetic = payload["phonetic"]
+            new_word.meanings = payload["meanings"]
+            new_word.provisional = False
+            new_word.retry_at = None
+            for field, value in llm_manager.provenance().items():
+                setattr(new_word, field, value)
+        else:
+            new_word = Word(
+                original=lookup_text,
+                target_lang=target_lang,
+                translation=payload["translation"],
+                phonetic=payload["phonetic"],
+                meanings=payload["meanings"],
+                phonetics=[],
+                audio_url=None,
+                learned=False,
+                **llm_manager.provenance()
+            )
+        session.add(new_word)
+        session.commit()
+        session.refresh(new_word)
+        await cache.set(word_cache_key(lookup_text, target_lang), word_payload(new_word), WORD_TTL)
+        logger.info(f"Saved new word to DB: {lookup_text}")
+    except Exception as db_err:
+        logger.error(f"Failed to save word to DB: {db_err}")
+        # Continue even if save fails, just return results
+    return payload
+
+def deadline_exceeded() -> bool:
+    deadline = current_deadline()
+    return bool(deadline and deadline.exceeded_stage)
+
+async def local_fallback(text: str, target_lang: str) -> Optional[Dict[str, Any]]:
+    """
+    The bundled ECDICT entry, when the LLM ran out of time. ECDICT is
+    English-Chinese, so other languages have no fallback.
+    """
+    if target_lang != DEFAULT_LANGUAGE:
+        return None
+    data = await fetch_ecdict_data(text)
+    if not data or not data.get("meanings"):
+        return None
+    return {
+        "translation": extract_simple_translation(data, text),
+        "phonetic": data.get("phonetic"),
+        "audio_url": None,
+        "meanings": data["meanings"],
+        "phonetics": [],
+        "lemma": data.get("lemma"),
+    }
 
 @router.post("/translate", response_model=TranslateResponse)
 async def translate_text(request: TranslateRequest, session: Session = Depends(get_session)):
-    # Determine target language specific name for the prompt
-    target_lang_name = "Chinese"
-    # if request.target_lang.lower().startswith("zh"):
-    #     target_lang_name = "Chinese"
-    # else:
-    #     # Fallback for other languages, though the prompt is optimized for Chinese
-    #     target_lang_name = request.target_lang
+    # Rows and caches are keyed by the language code, prompts use its name
+    target_lang_name = language_name(request.target_lang)
 
     try:
         if is_single_word(request.text):
-            # 1. Check DB first
+            # 1. Check the shared cache, then the DB
             # Use lower case for case-insensitive lookup if desired, but here we invoke strict check or simple logic
             # For now, let's query exact match or case-insensitive match.
             # SQLite default is case-insensitive for ASCII text, Postgres is case-sensitive.
@@ -47,81 +170,121 @@ async def translate_text(request: TranslateRequest, session: Session = Depends(g
             # However, SQLModel/SQLAlchemy 'ilike' is safer.
             
             # Simple approach: Check exact match first.
-            statement = select(Word).where(Word.original == request.text)
-            cached_word = session.exec(statement).first()
+            cached = await find_cached_word(session, request.text, request.target_lang)
+
+            # Inflected forms share their lemma's entry, so 'running' reuses 'run'
+            lemma = None
+            if not cached:
+                lemma = await within("ecdict", resolve_lemma(request.text))
+                if lemma:
+                    cached = await find_cached_word(session, lemma, request.target_lang)
             
-            if cached_word:
-                logger.info(f"Cache hit for word: {request.text}")
-                return TranslateResponse(
-                    translation=cached_word.translation,
-                    phonetic=cached_word.phonetic,
-                    audio_url=cached_word.audio_url,
-                    meanings=cached_word.meanings if cached_word.meanings else [],
-                    phonetics=cached_word.phonetics if cached_word.phonetics else [],
-                    detected_source_lang="en"
-                )
+            if cached:
+                logger.info(f"Cache hit for word: {request.text}" + (f" (lemma: {lemma})" if lemma else ""))
+                return TranslateResponse(**cached, detected_source_lang="en", lemma=lemma)
 
             # 2. Not in DB, fetch from Gemini
-            logger.info(f"Cache miss for word: {request.text}, fetching from Gemini...")
-            data = await lookup_word(request.text, target_lang_name)
-            
-            # Map Gemini response to TranslateResponse
-            
-            # Extract meanings
-            final_meanings = data.get("meanings", [])
-            
-            # Helper to find a simple translation (first definition)
-            simple_translation = data.get("word", request.text)
-            
-            if isinstance(final_meanings, list) and len(final_meanings) > 0:
-                # Try to get first definition as simple translation
-                first_meaning = final_meanings[0]
-                if isinstance(first_meaning, dict):
-                    defs = first_meaning.get("definitions", [])
-                    if isinstance(defs, list) and len(defs) > 0:
-                        first_def = defs[0]
-                        if isinstance(first_def, dict):
-                            simple_translation = first_def.get("definition", simple_translation)
-                        elif isinstance(first_def, str):
-                            # Fallback if Gemini returns simple string list
-                            simple_translation = first_def
-            
-            # 3. Save to DB
-            try:
-                new_word = Word(
-                    original=request.text,
-                    translation=simple_translation,
-                    phonetic=data.get("phonetic"),
-                    meanings=final_meanings,
-                    phonetics=[], # Structure different, omitting for now
-                    audio_url=None,
-                    learned=False
-                )
-                session.add(new_word)
-                session.commit()
-                session.refresh(new_word)
-                logger.info(f"Saved new word to DB: {request.text}")
-            except Exception as db_err:
-                logger.error(f"Failed to save word to DB: {db_err}")
-                # Continue even if save fails, just return results
-            
-            return TranslateResponse(
-                translation=simple_translation,
-                phonetic=data.get("phonetic"),
-                audio_url=None, 
-                meanings=final_meanings,
-                phonetics=[], 
-                detected_source_lang="en"
-            )
+            lookup_text = lemma or request.text
+            logger.info(f"Cache miss for word: {lookup_text}, fetching from Gemini...")
+            data = await lookup_word(lookup_text, target_lang_name)
+
+            # 3. Save to DB, using the first definition as the simple translation
+            payload = await save_lookup_result(session, lookup_text, request.target_lang, data)
+            return TranslateResponse(**payload, detected_source_lang="en", lemma=lemma)
             
         else:
             # Use Gemini for sentence translation
+            # Sentences still untranslated at the deadline come back as they are
             translation = await translate_sentence(request.text, target_lang_name)
             return TranslateResponse(
                 translation=translation,
-                detected_source_lang="en"
+                detected_source_lang="en",
+                partial=deadline_exceeded()
             )
 
+    except DeadlineExceeded as e:
+        fallback = await local_fallback(request.text, request.target_lang)
+        if fallback:
+            logger.info(f"{e}, answering '{request.text}' from ECDICT")
+            return TranslateResponse(**fallback, detected_source_lang="en", partial=True)
+        raise HTTPException(status_code=504, detail=str(e))
+    except LookupFailed as e:
+        # Remembered for NEGATIVE_TTL (FAILURE_TTL for failures), so retrying sooner gets the same answer
+        logger.info(str(e))
+        if e.not_found:
+            raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(FAILURE_TTL)})
     except Exception as e:
         logger.error(f"Translation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/translate/stream")
+async def translate_word_stream(request: TranslateRequest, session: Session = Depends(get_session)):
+    """
+    Look up a single word, streaming NDJSON events while the LLM writes its answer:
+    'phonetic', then one 'meaning' per completed entry, then 'done' with the
+    full TranslateResponse fields (or 'error'). Cached words go straight to 'done'.
+    At the request deadline 'done' carries partial=true and what was streamed so far.
+    """
+    if not is_single_word(request.text):
+        raise HTTPException(status_code=400, detail="Streaming lookup takes a single word")
+
+    target_lang_name = language_name(request.target_lang)
+
+    cached = await find_cached_word(session, request.text, request.target_lang)
+    lemma = None
+    if not cached:
+        try:
+            lemma = await within("ecdict", resolve_lemma(request.text))
+        except DeadlineExceeded:
+            lemma = None
+        if lemma:
+            cached = await find_cached_word(session, lemma, request.target_lang)
+
+    def event(name: str, **fields) -> str:
+        return json.dumps({"event": name, **fields}, ensure_ascii=False) + "\n"
+
+    async def stream():
+        if cached:
+            logger.info(f"Cache hit for word: {request.text}" + (f" (lemma: {lemma})" if lemma else ""))
+            yield event("done", **cached, detected_source_lang="en", lemma=lemma, cached=True)
+            return
+
+        lookup_text = lemma or request.text
+        phonetic = None
+        meanings = []
+        try:
+            async for name, value in stream_lookup_word(lookup_text, target_lang_name):
+                if name == "phonetic":
+                    phonetic = value
+                    yield event("phonetic", phonetic=value)
+                elif name == "meaning":
+                    yield event("meaning", index=len(meanings), meaning=value)
+                    meanings.append(value)
+                elif name == "result":
+                    # The request's session may already be closed while the body streams
+                    with Session(engine) as stream_session:
+                        payload = await save_lookup_result(stream_session, lookup_text, request.target_lang, value)
+                    yield event("done", **payload, detected_source_lang="en", lemma=lemma, cached=False)
+        except DeadlineExceeded as e:
+            # What was streamed so far, or the local dictionary entry
+            if meanings:
+                partial = {"word": lookup_text, "phonetic": phonetic, "meanings": meanings}
+                yield event("done", translation=extract_simple_translation(partial, lookup_text), phonetic=phonetic,
+                            audio_url=None, meanings=meanings, phonetics=[], detected_source_lang="en",
+                            lemma=lemma, cached=False, partial=True)
+                return
+            fallback = await local_fallback(lookup_text, request.target_lang)
+            if fallback:
+                fallback["lemma"] = lemma or fallback["lemma"]
+                yield event("done", **fallback, detected_source_lang="en", cached=False, partial=True)
+                return
+            yield event("error", detail=str(e), not_found=False, stage=e.stage)
+        except LookupFailed as e:
+            logger.info(str(e))
+            yield event("error", detail=str(e), not_found=e.not_found)
+        except Exception as e:
+            logger.error(f"Streaming lookup failed for '{lookup_text}': {e}")
+            yield event("error", detail=str(e), not_found=False)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,20 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlmodel import Session, select, SQLModel
-from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, SQLModel, Field
+from sqlalchemy import update, case
+from typing import Any, Dict, List, Literal, Optional
 import uuid
 import time
 import logging
 
 logger = logging.getLogger("api.words")
 
+from app.cache import cache, word_cache_key
 from app.database import get_session
-from app.gemini_service import lookup_word
+from app.gemini_service import lookup_word, extract_simple_translation
+from app.highlight_service import highlight_index
+from app.languages import normalize_language, language_name
+from app.suggest_service import suggest_index
+from app.retry_worker import next_retry_at
+from app.llm_scheduler import llm_priority, USER
+from app.llm_service import llm_manager
+from app.stats_service import word_state, record_change, record_changes, get_stats
 
 from app.models import Word
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 router = APIRouter(prefix="/words", tags=["words"])
 
+def check_target_lang(code: Optional[str]) -> str:
+    try:
+        return normalize_language(code)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("", response_model=Word)
@@ -24,69 +39,73 @@ async def save_word(request: Word, session: Session = Depends(get_session)):
     If word exists, update star=True.
     If word doesn't exist, fetch from Gemini, create it with star=True.
     """
-    # Check if word exists
-    statement = select(Word).where(Word.original == request.original)
+    target_lang = check_target_lang(request.target_lang)
+
+    # Check if word exists in this language
+    statement = select(Word).where(Word.original == request.original, Word.target_lang == target_lang)
     existing_word = session.exec(statement).first()
     
     if existing_word:
+        before = word_state(existing_word)
         existing_word.star = True
+        record_change(session, before, word_state(existing_word))
         session.add(existing_word)
         session.commit()
         session.refresh(existing_word)
+        highlight_index.sync_word(existing_word)
+        suggest_index.sync_word(existing_word)
         logger.info(f"Word '{request.original}' already exists, marked as starred.")
         return existing_word
         
     # If not exists, fetch and create
-    # We default target_lang to 'Chinese' for enrichment or we could accept it in request. 
-    # For simplicity, default to Chinese context as per app Settings default.
-    target_lang = "Chinese" 
-    
     try:
-        data = await lookup_word(request.original, target_lang)
+        # Starring is less urgent than a popup lookup
+        with llm_priority(USER):
+            data = await lookup_word(request.original, language_name(target_lang))
         
         # Extract fields similar to /translate logic
         final_meanings = data.get("meanings", [])
         
-        # Helper to find a simple translation
-        simple_translation = data.get("word", request.original)
-        if isinstance(final_meanings, list) and len(final_meanings) > 0:
-            first_meaning = final_meanings[0]
-            if isinstance(first_meaning, dict):
-                defs = first_meaning.get("definitions", [])
-                if isinstance(defs, list) and len(defs) > 0:
-                    first_def = defs[0]
-                    if isinstance(first_def, dict):
-                        simple_translation = first_def.get("definition", simple_translation)
-                    elif isinstance(first_def, str):
-                        simple_translation = first_def
+        simple_translation = extract_simple_translation(data, request.original)
 
         new_word = Word(
             original=request.original,
+            target_lang=target_lang,
             translation=simple_translation,
             phonetic=data.get("phonetic"),
             meanings=final_meanings,
             phonetics=[],
             audio_url=None,
             learned=False,
-            star=True
+            star=True,
+            **llm_manager.provenance()
         )
         session.add(new_word)
+        record_change(session, None, word_state(new_word))
         session.commit()
         session.refresh(new_word)
+        highlight_index.sync_word(new_word)
+        suggest_index.sync_word(new_word)
         logger.info(f"Word '{request.original}' not found, fetched from Gemini and saved.")
         return new_word
         
     except Exception as e:
         logger.error(f"Failed to fetch/save word '{request.original}': {e}")
-        # Fallback: create a basic entry if AI fails
+        # Fallback: keep the star with a provisional entry, the retry worker fills it in later
         fallback_word = Word(
             original=request.original,
+            target_lang=target_lang,
             translation=request.original,
-            star=True
+            star=True,
+            provisional=True,
+            retry_at=next_retry_at(0)
         )
         session.add(fallback_word)
+        record_change(session, None, word_state(fallback_word))
         session.commit()
         session.refresh(fallback_word)
+        highlight_index.sync_word(fallback_word)
+        suggest_index.sync_word(fallback_word)
         return fallback_word
 @router.get("", response_model=List[Word])
 def get_words(
@@ -94,12 +113,15 @@ def get_words(
     limit: int = 100, 
     offset: int = 0,
     start_time: Optional[float] = None,
-    end_time: Optional[float] = None
+    end_time: Optional[float] = None,
+    target_lang: Optional[str] = None
 ):
     """
-    Return list of saved words (sorted by newest).
+    Return list of saved words (sorted by newest), optionally of one target language.
     """
     query = select(Word).where(Word.star == True)
+    if target_lang:
+        query = query.where(Word.target_lang == check_target_lang(target_lang))
     
     if start_time:
         query = query.where(Word.timestamp >= start_time)
@@ -115,15 +137,102 @@ def get_words(
     
     return results
 
+@router.get("/stats")
+def get_word_stats(
+    session: Session = Depends(get_session),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Starred and learned totals, with words added (and learned since) per
+    day, from precomputed daily rollups. Dates are UTC, YYYY-MM-DD.
+    """
+    t0 = time.time()
+    stats = get_stats(session, start_date, end_date)
+    duration = time.time() - t0
+    logger.info(f"DB Query (get_word_stats) took: {duration:.4f}s")
+    return stats
+
+# SM-2 parameters
+MIN_EASE = 1.3
+# Failed cards come back after ten minutes
+RELEARN_INTERVAL_DAYS = 10 / (24 * 60)
+
+class ReviewGrade(SQLModel):
+    # 0-5, where 3 or more means the card was recalled
+    grade: int = Field(ge=0, le=5)
+
+@router.get("/review", response_model=List[Word])
+def get_review_queue(session: Session = Depends(get_session), limit: int = 20, target_lang: Optional[str] = None):
+    """
+    Return the next starred, not yet learned words that are due for review.
+    """
+    now = time.time()
+    statement = (
+        select(Word)
+        .where(Word.star == True, Word.learned == False, Word.due <= now)
+    )
+    if target_lang:
+        statement = statement.where(Word.target_lang == check_target_lang(target_lang))
+    # A range scan of ix_word_review, already in due order
+    statement = statement.order_by(Word.due).limit(limit)
+    
+    t0 = time.time()
+    results = session.exec(statement).all()
+    duration = time.time() - t0
+    logger.info(f"DB Query (get_review_queue) took: {duration:.4f}s")
+    
+    return results
+
+@router.post("/review/{word_id}", response_model=Word)
+def grade_word(word_id: uuid.UUID, review: ReviewGrade, session: Session = Depends(get_session)):
+    """
+    Grade a review and reschedule the word (SM-2) in a single UPDATE.
+    """
+    quality = review.grade
+    ease_delta = 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    new_ease = case((Word.ease + ease_delta < MIN_EASE, MIN_EASE), else_=Word.ease + ease_delta)
+
+    if quality < 3:
+        new_reps = 0
+        new_interval = RELEARN_INTERVAL_DAYS
+    else:
+        new_reps = Word.reps + 1
+        new_interval = case(
+            (Word.reps == 0, 1.0),
+            (Word.reps == 1, 6.0),
+            else_=Word.interval_days * Word.ease
+        )
+
+    statement = (
+        update(Word)
+        .where(Word.id == word_id)
+        .values(
+            reps=new_reps,
+            interval_days=new_interval,
+            ease=new_ease,
+            due=time.time() + new_interval * 86400
+        )
+        .returning(Word)
+    )
+    word = session.exec(statement).scalars().first()
+    if not word:
+        raise HTTPException(status_code=404, detail="Word not found")
+    session.commit()
+    session.refresh(word)
+    return word
+
 @router.post("/save", response_model=Word)
 def create_word(word_data: Word, session: Session = Depends(get_session)):
     """
-    Save a new word. Checks for duplicates by 'original' text.
+    Save a new word. Checks for duplicates by 'original' text and target language.
     If duplicate exists, returns the existing one (idempotent).
     """
+    word_data.target_lang = check_target_lang(word_data.target_lang)
+
     # Check for duplicate
     t0 = time.time()
-    statement = select(Word).where(Word.original == word_data.original)
+    statement = select(Word).where(Word.original == word_data.original, Word.target_lang == word_data.target_lang)
     existing_word = session.exec(statement).first()
     if existing_word:
         duration = time.time() - t0
@@ -133,8 +242,11 @@ def create_word(word_data: Word, session: Session = Depends(get_session)):
     # Create new
     # Ensure ID is new (or let DB handle it if we didn't pass one, but Pydantic factory handles it)
     session.add(word_data)
+    record_change(session, None, word_state(word_data))
     session.commit()
     session.refresh(word_data)
+    highlight_index.sync_word(word_data)
+    suggest_index.sync_word(word_data)
     duration = time.time() - t0
     logger.info(f"DB Create (create_word) took: {duration:.4f}s")
     return word_data
@@ -144,9 +256,13 @@ def unstar_word(word_id: uuid.UUID, session: Session = Depends(get_session)):
     word = session.get(Word, word_id)
     if not word:
         raise HTTPException(status_code=404, detail="Word not found")
+    before = word_state(word)
     word.star = False
+    record_change(session, before, None)
     session.add(word)
     session.commit()
+    highlight_index.sync_word(word)
+    suggest_index.sync_word(word)
     return {"message": "Word unstarred"}
 
 class WordUpdate(SQLModel):
@@ -158,22 +274,150 @@ class WordUpdate(SQLModel):
     learned: Optional[bool] = None
     star: Optional[bool] = None
 
-@router.patch("/{word_id}", response_model=Word)
-def update_word(word_id: uuid.UUID, word_update: WordUpdate, session: Session = Depends(get_session)):
+def apply_word_update(session: Session, word_id: uuid.UUID, word_update: WordUpdate):
     """
-    Update word fields (e.g. learned=True).
+    The DB side of update_word; returns the updated word and its previous spelling.
     """
     db_word = session.get(Word, word_id)
     if not db_word:
         raise HTTPException(status_code=404, detail="Word not found")
 
     word_data = word_update.model_dump(exclude_unset=True)
+    previous_original = db_word.original
+    before = word_state(db_word)
     
     for key, value in word_data.items():
         if hasattr(db_word, key):
             setattr(db_word, key, value)
     
+    record_change(session, before, word_state(db_word))
     session.add(db_word)
     session.commit()
     session.refresh(db_word)
+    highlight_index.sync_word(db_word, previous_original)
+    suggest_index.sync_word(db_word, previous_original)
+    return db_word, previous_original
+
+@router.patch("/{word_id}", response_model=Word)
+async def update_word(word_id: uuid.UUID, word_update: WordUpdate, session: Session = Depends(get_session)):
+    """
+    Update word fields (e.g. learned=True).
+    """
+    # Sync DB work stays off the event loop; only the cache invalidation is awaited here
+    db_word, previous_original = await run_in_threadpool(apply_word_update, session, word_id, word_update)
+    # Lookups of this word (and its old spelling) must not serve the old entry
+    await cache.invalidate(word_cache_key(previous_original, db_word.target_lang))
+    if db_word.original != previous_original:
+        await cache.invalidate(word_cache_key(db_word.original, db_word.target_lang))
     return db_word
+
+# Upper bound for the operations of a single bulk request
+MAX_BULK_OPERATIONS = 500
+
+# Values each bulk action sets; 'update' sets its own fields
+BULK_ACTION_VALUES = {
+    "star": {"star": True},
+    "unstar": {"star": False},
+    "learned": {"learned": True},
+    "unlearned": {"learned": False},
+}
+
+class BulkOperation(SQLModel):
+    id: uuid.UUID
+    action: Literal["star", "unstar", "learned", "unlearned", "update"]
+    # Fields for 'update', as in PATCH /words/{id}
+    fields: Optional[WordUpdate] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.action == "update" and (not self.fields or not self.fields.model_dump(exclude_unset=True)):
+            raise ValueError("'update' operations need at least one field")
+        return self
+
+class BulkRequest(SQLModel):
+    operations: List[BulkOperation]
+
+class BulkResult(SQLModel):
+    id: uuid.UUID
+    action: str
+    # 'ok' or 'not_found'
+    status: str
+
+class BulkResponse(SQLModel):
+    updated: int
+    results: List[BulkResult]
+
+def apply_bulk_operations(session: Session, operations: List[BulkOperation]):
+    """
+    The DB side of bulk_update_words. Returns the rows found, the value
+    groups that were applied and each changed word's previous spelling.
+    """
+    values_by_id: Dict[uuid.UUID, Dict[str, Any]] = {}
+    for operation in operations:
+        if operation.action == "update":
+            values = operation.fields.model_dump(exclude_unset=True)
+        else:
+            values = BULK_ACTION_VALUES[operation.action]
+        values_by_id.setdefault(operation.id, {}).update(values)
+
+    # One read for existence, stats and index updates; the rows are not written through the ORM
+    words = {word.id: word for word in session.exec(select(Word).where(Word.id.in_(list(values_by_id)))).all()}
+    session.expunge_all()
+
+    groups: Dict[tuple, List[uuid.UUID]] = {}
+    for word_id, values in values_by_id.items():
+        if word_id in words:
+            groups.setdefault(tuple(sorted(values.items())), []).append(word_id)
+
+    changes = []
+    previous_originals = {}
+    for values, word_ids in groups.items():
+        values = dict(values)
+        session.exec(update(Word).where(Word.id.in_(word_ids)).values(**values).execution_options(synchronize_session=False))
+        for word_id in word_ids:
+            word = words[word_id]
+            before = word_state(word)
+            previous_originals[word_id] = word.original
+            for key, value in values.items():
+                setattr(word, key, value)
+            changes.append((before, word_state(word)))
+    record_changes(session, changes)
+    session.commit()
+
+    for word_ids in groups.values():
+        for word_id in word_ids:
+            highlight_index.sync_word(words[word_id], previous_originals[word_id])
+            suggest_index.sync_word(words[word_id], previous_originals[word_id])
+    return words, groups, previous_originals
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_update_words(request: BulkRequest, session: Session = Depends(get_session)):
+    """
+    Apply many star/unstar/learned/update operations in one transaction.
+    Operations on the same word are merged in order, then words that end up
+    with the same values are changed by a single UPDATE ... WHERE id IN (...).
+    """
+    if len(request.operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations per request")
+
+    t0 = time.time()
+    # Sync DB work and index updates stay off the event loop
+    words, groups, previous_originals = await run_in_threadpool(apply_bulk_operations, session, request.operations)
+
+    for values, word_ids in groups.items():
+        # Only fields of the lookup payload make cached entries stale
+        if all(key in ("star", "learned") for key, _ in values):
+            continue
+        for word_id in word_ids:
+            word, previous_original = words[word_id], previous_originals[word_id]
+            await cache.invalidate(word_cache_key(previous_original, word.target_lang))
+            if word.original != previous_original:
+                await cache.invalidate(word_cache_key(word.original, word.target_lang))
+
+    results = [
+        BulkResult(id=operation.id, action=operation.action, status="ok" if operation.id in words else "not_found")
+        for operation in request.operations
+    ]
+    duration = time.time() - t0
+    logger.info(f"DB Bulk update ({len(request.operations)} operations, {len(groups)} statements) took: {duration:.4f}s")
+    return BulkResponse(updated=sum(len(word_ids) for word_ids in groups.values()), results=results)
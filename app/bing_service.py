@@ -2,6 +2,7 @@ import httpx
 from bs4 import BeautifulSoup
 from typing import Optional, Dict, List
 import logging
+from app.deadline import HTTP_TIMEOUT, timeout_for, note_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,8 @@ async def fetch_bing_data(word: str) -> Optional[Dict]:
     Scrapes cn.bing.com for rich dictionary data (EN -> ZH).
     Returns structure compatible with our app's needs.
     """
-    async with httpx.AsyncClient() as client:
+    # Bounded by what is left of the request deadline
+    async with httpx.AsyncClient(timeout=timeout_for(HTTP_TIMEOUT)) as client:
         try:
             # Add headers to look like a real browser
             headers = {
@@ -104,6 +106,10 @@ async def fetch_bing_data(word: str) -> Optional[Dict]:
                 "phonetics": [] # We could populate detailed list if needed
             }
 
+        except httpx.TimeoutException:
+            note_timeout("bing")
+            logger.error(f"Bing timed out for {word}")
+            return None
         except Exception as e:
             logger.error(f"Bing scraping failed: {e}")
             return None
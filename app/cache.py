@@ -0,0 +1,385 @@
+"""
+Shared Cache
+Two-level cache for lookup results: an in-process LRU (L1) in front of an
+optional Redis-protocol server (L2) shared by all workers and instances.
+Invalidations are broadcast over pub/sub so every worker drops its L1 copy.
+The same channel carries named signals, e.g. for per-worker indexes of
+saved words to reload after another worker changed a word.
+
+Configure with CACHE_URL=redis://host:6379/0; without it only L1 is used.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "lingualearn:invalidate"
+# Signals are published as 'signal:<name>:<origin>', the origin tells a worker its own messages
+SIGNAL_PREFIX = "signal:"
+
+# TTLs in seconds per kind of entry
+WORD_TTL = int(os.environ.get("CACHE_WORD_TTL", str(7 * 86400)))
+SENTENCE_TTL = int(os.environ.get("CACHE_SENTENCE_TTL", str(30 * 86400)))
+PROVIDER_TTL = int(os.environ.get("CACHE_PROVIDER_TTL", str(30 * 86400)))
+# Words the provider knows no meanings for are remembered this long, so repeats skip the LLM
+NEGATIVE_TTL = int(os.environ.get("CACHE_NEGATIVE_TTL", "600"))
+# Provider failures only briefly, so an outage stops being served once the provider recovers
+FAILURE_TTL = int(os.environ.get("CACHE_FAILURE_TTL", "30"))
+
+
+def cache_key(namespace: str, *parts: str) -> str:
+    """
+    Build a cache key; long free-text parts (sentences) are hashed.
+    """
+    safe_parts = [p if len(p) <= 64 else hashlib.sha1(p.encode("utf-8")).hexdigest() for p in parts]
+    return ":".join([namespace, *safe_parts])
+
+
+def word_cache_key(original: str, target_lang: str) -> str:
+    return cache_key("word", target_lang, original)
+
+
+def negative_cache_key(namespace: str, *parts: str) -> str:
+    return cache_key("miss", namespace, *parts)
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+
+    def get_nowait(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set_nowait(self, key: str, value: Any, ttl: Optional[int] = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete_nowait(self, key: str):
+        self._data.pop(key, None)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.get_nowait(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self.set_nowait(key, value, ttl)
+
+    async def delete(self, key: str):
+        self.delete_nowait(key)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    One connection speaking RESP2, enough for GET/SET/DEL/PUBLISH/SUBSCRIBE.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, password: Optional[str], db: int, timeout: float) -> "RedisConnection":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        conn = cls(reader, writer)
+        if password:
+            await conn.execute("AUTH", password)
+        if db:
+            await conn.execute("SELECT", str(db))
+        return conn
+
+    @staticmethod
+    def _encode(args: Tuple) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(out)
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def send(self, *args):
+        self.writer.write(self._encode(args))
+        await self.writer.drain()
+
+    async def execute(self, *args) -> Any:
+        await self.send(*args)
+        return await self.read_reply()
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisCache(CacheBackend):
+    """
+    L2 backend for any server speaking the Redis protocol.
+    Values are stored as JSON.
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._pool: List[RedisConnection] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> RedisConnection:
+        return await RedisConnection.open(self.host, self.port, self.password, self.db, self.timeout)
+
+    async def execute(self, *args) -> Any:
+        async with self._slots:
+            conn = self._pool.pop() if self._pool else await self._connect()
+            try:
+                result = await asyncio.wait_for(conn.execute(*args), self.timeout)
+            except RedisError:
+                # Protocol-level error, the connection itself is fine
+                self._pool.append(conn)
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            self._pool.append(conn)
+            return result
+
+    async def get(self, key: str) -> Optional[Any]:
+        data = await self.execute("GET", key)
+        return json.loads(data) if data is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        data = json.dumps(value, ensure_ascii=False)
+        if ttl:
+            await self.execute("SET", key, data, "EX", str(int(ttl)))
+        else:
+            await self.execute("SET", key, data)
+
+    async def delete(self, key: str):
+        await self.execute("DEL", key)
+
+    async def publish(self, channel: str, message: str):
+        await self.execute("PUBLISH", channel, message)
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """
+        Call `callback` for every message on `channel`, reconnecting on errors.
+        Runs until cancelled.
+        """
+        while True:
+            conn = None
+            try:
+                conn = await self._connect()
+                await conn.execute("SUBSCRIBE", channel)
+                while True:
+                    reply = await conn.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        callback(reply[2].decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation subscriber disconnected: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if conn:
+                    conn.close()
+
+    def close(self):
+        for conn in self._pool:
+            conn.close()
+        self._pool = []
+
+
+class TieredCache:
+    """
+    Read path: L1, then L2 (filling L1). Writes go to both levels.
+    L2 failures are logged and treated as misses, never as request errors.
+    """
+
+    def __init__(self, local: MemoryCache, shared: Optional[RedisCache] = None, local_ttl: int = 300):
+        self.local = local
+        self.shared = shared
+        # L1 copies live shorter than L2 entries so missed invalidations heal
+        self.local_ttl = local_ttl
+        self._subscriber: Optional[asyncio.Task] = None
+        # After an L2 failure, skip L2 for a while instead of timing out on every request
+        self.retry_after = 10
+        self._shared_down_until = 0.0
+        self._origin = uuid.uuid4().hex
+        self._signal_handlers: Dict[str, List[Callable[[], None]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "TieredCache":
+        local = MemoryCache(int(os.environ.get("CACHE_LOCAL_SIZE", "10000")))
+        url = os.environ.get("CACHE_URL")
+        shared = RedisCache(url) if url else None
+        return cls(local, shared, int(os.environ.get("CACHE_LOCAL_TTL", "300")))
+
+    def _shared_available(self) -> bool:
+        return self.shared is not None and time.monotonic() >= self._shared_down_until
+
+    def _shared_failed(self, action: str, error: Exception):
+        logger.warning(f"Shared cache {action} failed, using local cache only for {self.retry_after}s: {error}")
+        self._shared_down_until = time.monotonic() + self.retry_after
+
+    def _local_ttl(self, ttl: Optional[int]) -> Optional[int]:
+        if not self.shared:
+            return ttl
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get_nowait(key)
+        if value is not None or not self._shared_available():
+            return value
+        try:
+            value = await self.shared.get(key)
+        except Exception as e:
+            self._shared_failed("get", e)
+            return None
+        if value is not None:
+            self.local.set_nowait(key, value, self._local_ttl(None))
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self.local.set_nowait(key, value, self._local_ttl(ttl))
+        if self._shared_available():
+            try:
+                await self.shared.set(key, value, ttl)
+            except Exception as e:
+                self._shared_failed("set", e)
+
+    async def invalidate(self, key: str):
+        """
+        Drop a key everywhere, including other workers' L1 copies.
+        """
+        self.local.delete_nowait(key)
+        if self._shared_available():
+            try:
+                await self.shared.delete(key)
+                await self.shared.publish(INVALIDATION_CHANNEL, key)
+            except Exception as e:
+                self._shared_failed("invalidation", e)
+
+    def on_signal(self, name: str, handler: Callable[[], None]):
+        """
+        Call `handler` on the event loop whenever another worker sends signal `name`.
+        """
+        self._signal_handlers.setdefault(name, []).append(handler)
+
+    def signal(self, name: str):
+        """
+        Tell the other workers that `name` changed. Fire-and-forget,
+        callable from request threads as well as from the event loop.
+        """
+        if self.shared and self._loop:
+            self._loop.call_soon_threadsafe(self._send_signal, name)
+
+    def _send_signal(self, name: str):
+        task = asyncio.create_task(self._publish(f"{SIGNAL_PREFIX}{name}:{self._origin}"))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish(self, message: str):
+        if self._shared_available():
+            try:
+                await self.shared.publish(INVALIDATION_CHANNEL, message)
+            except Exception as e:
+                self._shared_failed("signal", e)
+
+    def _on_message(self, message: str):
+        if not message.startswith(SIGNAL_PREFIX):
+            self.local.delete_nowait(message)
+            return
+        name, origin = message[len(SIGNAL_PREFIX):].rsplit(":", 1)
+        if origin == self._origin:
+            return
+        for handler in self._signal_handlers.get(name, []):
+            try:
+                handler()
+            except Exception as e:
+                logger.error(f"Handler of cache signal '{name}' failed: {e}")
+
+    async def start(self):
+        if self.shared and not self._subscriber:
+            self._loop = asyncio.get_running_loop()
+            self._subscriber = asyncio.create_task(
+                self.shared.subscribe(INVALIDATION_CHANNEL, self._on_message)
+            )
+            logger.info(f"Shared cache enabled at {self.shared.host}:{self.shared.port}")
+
+    async def stop(self):
+        if self._subscriber:
+            self._subscriber.cancel()
+            self._subscriber = None
+        self._loop = None
+        if self.shared:
+            self.shared.close()
+
+
+# Global instance
+cache = TieredCache.from_env()
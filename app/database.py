@@ -1,9 +1,25 @@
+"""
+Database
+SQLModel engine and session for Postgres (DATABASE_URL) or a local SQLite
+fallback, plus the lightweight startup migration in add_missing_columns.
+
+On Postgres every transaction is limited to the request deadline with
+SET LOCAL statement_timeout when it begins. The limit is fixed at BEGIN
+and applies to each statement separately, so a transaction running
+several statements can still outlast the deadline; keep request
+transactions short.
+"""
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event, inspect, text
 import os
+import logging
 from dotenv import load_dotenv
+from app import deadline
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Use proper connection handling
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL or "postgres.USER" in DATABASE_URL:
@@ -27,9 +43,70 @@ engine = create_engine(
     pool_pre_ping=False # Automatically reconnect if connection drops
 )
 
+# Statements get at least this long, so writes that keep user intent (stars, fallbacks) still land
+DB_MIN_STATEMENT_TIMEOUT = 1.0
+# SQLSTATE of query_canceled, raised when statement_timeout fires
+QUERY_CANCELED = "57014"
+
+@event.listens_for(engine, "begin")
+def limit_statement_time(conn):
+    # Postgres cancels statements that would run past the request deadline
+    left = deadline.remaining()
+    if left is not None and conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(max(left, DB_MIN_STATEMENT_TIMEOUT) * 1000)}")
+
+@event.listens_for(engine, "handle_error")
+def note_statement_timeout(context):
+    # A statement cancelled at the deadline makes the database the stage that blew it
+    error = context.original_exception
+    # psycopg2 names the SQLSTATE pgcode, psycopg 3 sqlstate
+    if QUERY_CANCELED in (getattr(error, "pgcode", None), getattr(error, "sqlstate", None)):
+        deadline.note_timeout("db")
+
 def get_session():
     with Session(engine) as session:
         yield session
 
+def backfill_column(conn, table, column):
+    """
+    Fill NULLs of a NOT NULL model column from the column named in its
+    `backfill_from` info, then enforce NOT NULL where the database can
+    (Postgres; SQLite cannot alter a column, the model keeps new rows filled).
+    """
+    source = table.columns[column.info["backfill_from"]]
+    result = conn.execute(table.update().where(column == None).values({column.name: source}))
+    if result.rowcount:
+        logger.info(f"Backfilled {result.rowcount} rows of {table.name}.{column.name} from {source.name}")
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" SET NOT NULL'))
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables. Add columns and indexes that were
+    added to a model after its table was created, filling in scalar defaults
+    and backfilling columns that became NOT NULL.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    if "backfill_from" in column.info and not column.nullable and existing[column.name]["nullable"]:
+                        backfill_column(conn, table, column)
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                if column.default is not None and column.default.is_scalar:
+                    conn.execute(table.update().values({column.name: column.default.arg}))
+                logger.info(f"Added column {table.name}.{column.name}")
+                if "backfill_from" in column.info and not column.nullable:
+                    backfill_column(conn, table, column)
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
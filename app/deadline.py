@@ -0,0 +1,203 @@
+"""
+Request Deadlines
+Every API request runs under a time budget: the route default from
+ROUTE_DEADLINES (or REQUEST_DEADLINE), shortened by the client with
+`X-Request-Timeout-Ms`. The deadline lives in a contextvar, so each tier
+reads what is left of it:
+
+  db       Postgres statement_timeout (with a floor, so writes still land)
+  ecdict   skipped once the budget is spent
+  llm      provider calls get the remaining time as their HTTP timeout,
+           the awaiting request stops waiting at the deadline
+  http     httpx providers (Bing, Free Dictionary) likewise
+
+Handlers catch DeadlineExceeded and answer with what they have. The first
+stage that ran out of time is logged, counted in
+request_deadline_exceeded_total and returned in `X-Deadline-Exceeded`.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Default budget in seconds for routes not listed below (0 disables)
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", "10"))
+# Upper bound for budgets asked for by clients
+MAX_REQUEST_DEADLINE = float(os.environ.get("MAX_REQUEST_DEADLINE", "60"))
+# Per-route budgets; None runs without a deadline unless the client sets one
+ROUTE_DEADLINES: Dict[str, Optional[float]] = {
+    "/api/translate": 8.0,
+    "/api/translate/stream": 30.0,
+    "/api/words": 15.0,
+    "/api/subtitles/translate": None,
+}
+DEADLINE_HEADER = b"x-request-timeout-ms"
+
+# Provider timeouts when no deadline applies
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10"))
+
+deadline_exceeded_total = metrics.counter(
+    "request_deadline_exceeded_total", "Requests that ran out of time, by the stage that blew the budget",
+    ["route", "stage"]
+)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        # Seconds spent per stage, and the first stage that ran out of time
+        self.stages: Dict[str, float] = {}
+        self.exceeded_stage: Optional[str] = None
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        if self.exceeded_stage is None:
+            self.exceeded_stage = stage
+        return DeadlineExceeded(stage)
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left for the current request, or None without a deadline.
+    """
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline else None
+
+
+def timeout_for(default: float) -> float:
+    """
+    Timeout for a blocking provider call: the remaining budget, at most `default`.
+    """
+    left = remaining()
+    return default if left is None else max(min(default, left), 0.001)
+
+
+def check(stage: str):
+    """
+    Raise DeadlineExceeded if the budget is already spent before `stage`.
+    """
+    deadline = _current_deadline.get()
+    if deadline and deadline.expired:
+        raise deadline.exceeded(stage)
+
+
+def note_timeout(stage: str) -> Optional[DeadlineExceeded]:
+    """
+    After a provider timed out: the DeadlineExceeded to raise if that was
+    the request deadline rather than the provider's own timeout.
+    """
+    deadline = _current_deadline.get()
+    if deadline and deadline.remaining() < 0.01:
+        return deadline.exceeded(stage)
+    return None
+
+
+async def within(stage: str, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable` for at most the remaining budget, cancelling it on expiry.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await awaitable
+    started = time.monotonic()
+    try:
+        if deadline.expired:
+            raise asyncio.TimeoutError
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        if asyncio.iscoroutine(awaitable):
+            # Not started because the budget was already spent
+            awaitable.close()
+        raise deadline.exceeded(stage) from None
+    finally:
+        deadline.record(stage, time.monotonic() - started)
+
+
+def route_budget(path: str) -> Optional[float]:
+    if path in ROUTE_DEADLINES:
+        return ROUTE_DEADLINES[path]
+    return REQUEST_DEADLINE or None
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware that starts the deadline of each HTTP request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _budget(scope) -> Optional[float]:
+        budget = route_budget(scope["path"])
+        for name, value in scope.get("headers", []):
+            if name == DEADLINE_HEADER:
+                try:
+                    requested = int(value) / 1000
+                except ValueError:
+                    break
+                if requested > 0:
+                    budget = min(requested, budget or MAX_REQUEST_DEADLINE, MAX_REQUEST_DEADLINE)
+                break
+        return budget
+
+    async def __call__(self, scope, receive, send):
+        budget = self._budget(scope) if scope["type"] == "http" else None
+        if not budget:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(budget)
+
+        async def deadline_send(message):
+            if message["type"] == "http.response.start" and deadline.exceeded_stage:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-deadline-exceeded", deadline.exceeded_stage.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_deadline.set(deadline)
+        try:
+            await self.app(scope, receive, deadline_send)
+        finally:
+            _current_deadline.reset(token)
+            if deadline.exceeded_stage:
+                # Path parameters are put back as placeholders, so ids don't become label values
+                route = scope["path"]
+                for name, value in scope.get("path_params", {}).items():
+                    route = route.replace(str(value), "{" + name + "}")
+                deadline_exceeded_total.inc(route=route, stage=deadline.exceeded_stage)
+                spent = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in deadline.stages.items())
+                logger.warning(f"Deadline of {budget:.1f}s exceeded in {deadline.exceeded_stage}: "
+                               f"{scope['method']} {scope['path']} ({spent})")
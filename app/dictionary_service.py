@@ -1,5 +1,9 @@
 import httpx
 from typing import Dict, Optional, List
+import logging
+from app.deadline import HTTP_TIMEOUT, timeout_for, note_timeout
+
+logger = logging.getLogger(__name__)
 
 # Using the Free Dictionary API
 DICTIONARY_API_URL = "https://api.dictionaryapi.dev/api/v2/entries/en/{word}"
@@ -9,11 +13,12 @@ async def fetch_dictionary_data(word: str) -> Optional[Dict]:
     Fetches dictionary data (phonetics, meanings, audio) for a given word.
     Returns a simplified dictionary structure or None if not found.
     """
-    async with httpx.AsyncClient() as client:
+    # Bounded by what is left of the request deadline
+    async with httpx.AsyncClient(timeout=timeout_for(HTTP_TIMEOUT)) as client:
         try:
             resp = await client.get(DICTIONARY_API_URL.format(word=word))
             if resp.status_code != 200:
-                print(f"Dictionary API failed for {word}: {resp.status_code}")
+                logger.error(f"Dictionary API failed for {word}: {resp.status_code}")
                 return None
             
             data = resp.json()
@@ -65,6 +70,10 @@ async def fetch_dictionary_data(word: str) -> Optional[Dict]:
                 "meanings": meanings_list
             }
 
+        except httpx.TimeoutException:
+            note_timeout("dictionary")
+            logger.error(f"Dictionary API timed out for {word}")
+            return None
         except Exception as e:
-            print(f"Error fetching dictionary data: {e}")
+            logger.error(f"Error fetching dictionary data: {e}")
             return None
@@ -0,0 +1,326 @@
+"""
+ECDICT Database Builder
+Streams the ECDICT CSV (stardict.csv / ecdict.csv) into a lookup-optimized
+SQLite file used by ecdict_service.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+from app.ecdict_service import (
+    SCHEMA_VERSION, IMAGE_MAGIC, IMAGE_FORMAT_VERSION, IMAGE_HEADER,
+    parse_translation, format_phonetic, read_meta,
+)
+
+logger = logging.getLogger(__name__)
+
+# Point lookups touch one leaf page each; 4 KB matches the OS page size
+PAGE_SIZE = 4096
+INSERT_BATCH = 10000
+
+SCHEMA = """
+CREATE TABLE entries (
+    key TEXT NOT NULL,          -- lowercase headword, the lookup key
+    word TEXT NOT NULL,         -- original spelling
+    phonetic TEXT,
+    meanings TEXT,              -- pre-parsed meanings JSON
+    collins INTEGER,
+    oxford INTEGER,
+    tag TEXT,
+    bnc INTEGER,
+    frq INTEGER,
+    exchange TEXT,
+    PRIMARY KEY (key, word)
+) WITHOUT ROWID;
+
+-- inflected form -> lemma, from the 'exchange' column
+CREATE TABLE lemmas (
+    form TEXT PRIMARY KEY,      -- lowercase inflected form
+    lemma TEXT NOT NULL,
+    kind TEXT                   -- exchange type: p, d, i, 3, r, t, s
+) WITHOUT ROWID;
+
+CREATE TABLE meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+# Exchange types that name an inflected form of the entry,
+# e.g. 'p:went/d:gone/i:going/3:goes'. '0' names the entry's own lemma.
+INFLECTION_TYPES = {"p", "d", "i", "3", "r", "t", "s"}
+
+
+def parse_exchange(exchange: Optional[str]) -> Dict[str, str]:
+    """
+    Parse 'p:went/d:gone/0:go/1:p' into {'p': 'went', 'd': 'gone', '0': 'go', '1': 'p'}.
+    """
+    result = {}
+    if not exchange:
+        return result
+    for part in exchange.split('/'):
+        if ':' in part:
+            kind, value = part.split(':', 1)
+            if kind and value:
+                result[kind] = value.strip()
+    return result
+
+
+def build_lemma_index(conn: sqlite3.Connection):
+    """
+    Fill the `lemmas` table from the `exchange` column of all entries.
+    """
+    conn.execute("CREATE TEMP TABLE lemma_candidates (form TEXT, lemma TEXT, kind TEXT, priority INTEGER)")
+    # Forms that are headwords with their own inflections ('saw', 'found')
+    # are words in their own right and must not be folded into another lemma
+    conn.execute("CREATE TEMP TABLE base_forms (form TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    batch = []
+    base_forms = []
+    for key, word, exchange, frq in conn.execute("SELECT key, word, exchange, frq FROM entries WHERE exchange IS NOT NULL"):
+        parsed = parse_exchange(exchange)
+        if INFLECTION_TYPES & parsed.keys():
+            base_forms.append((key,))
+
+        # The entry's own lemma declaration wins over reverse mappings
+        lemma = parsed.get("0")
+        if lemma and lemma.lower() != key:
+            batch.append((key, lemma, parsed.get("1", "")[:1], 0))
+
+        # Otherwise prefer the most frequent lemma ('leaves' -> 'leave' over 'leaf')
+        priority = frq if frq > 0 else 10 ** 9
+        for kind in INFLECTION_TYPES & parsed.keys():
+            form = parsed[kind].lower()
+            if form and form != key:
+                batch.append((form, word, kind, priority))
+
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany("INSERT INTO lemma_candidates VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO lemma_candidates VALUES (?, ?, ?, ?)", batch)
+    conn.executemany("INSERT OR IGNORE INTO base_forms VALUES (?)", base_forms)
+
+    # SQLite returns the bare columns of the row holding min(priority)
+    conn.execute("""
+        INSERT INTO lemmas (form, lemma, kind)
+        SELECT form, lemma, kind FROM (
+            SELECT form, lemma, kind, min(priority) FROM lemma_candidates
+            WHERE form NOT IN (SELECT form FROM base_forms)
+            GROUP BY form
+        )
+    """)
+    conn.execute("DROP TABLE lemma_candidates")
+    conn.execute("DROP TABLE base_forms")
+    conn.commit()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _int(value: Optional[str]) -> int:
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
+
+
+def iter_csv_entries(csv_path: str) -> Iterator[Tuple]:
+    """
+    Yield `entries` rows from the ECDICT CSV without loading it into memory.
+    """
+    # Some 'detail' fields exceed the default csv field limit
+    csv.field_size_limit(sys.maxsize)
+
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            word = (row.get("word") or "").strip()
+            if not word:
+                continue
+            meanings = parse_translation(row.get("translation") or "", row.get("pos") or "")
+            yield (
+                word.lower(),
+                word,
+                format_phonetic(row.get("phonetic")),
+                json.dumps(meanings, ensure_ascii=False, separators=(",", ":")) if meanings else None,
+                _int(row.get("collins")),
+                _int(row.get("oxford")),
+                row.get("tag") or None,
+                _int(row.get("bnc")),
+                _int(row.get("frq")),
+                row.get("exchange") or None,
+            )
+
+
+def build_database(csv_path: str, db_path: str, version: Optional[str] = None) -> Dict[str, str]:
+    """
+    Build a fresh lookup database from the ECDICT CSV at `csv_path`.
+    The file is written next to `db_path` and swapped in atomically.
+    Returns the metadata recorded in the `meta` table.
+    """
+    started = time.time()
+    tmp_path = f"{db_path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    logger.info(f"Computing checksum of {csv_path}...")
+    source_sha256 = file_sha256(csv_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # page_size must be set before the first table is created
+        conn.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+        # Nothing to protect while building a throwaway file
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.executescript(SCHEMA)
+
+        count = 0
+        batch = []
+        for entry in iter_csv_entries(csv_path):
+            batch.append(entry)
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                count += len(batch)
+                batch = []
+                if count % 200000 == 0:
+                    logger.info(f"Imported {count} rows...")
+        if batch:
+            conn.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+
+        logger.info("Building inflection index...")
+        build_lemma_index(conn)
+
+        entries = conn.execute("SELECT count(*) FROM entries").fetchone()[0]
+        lemmas = conn.execute("SELECT count(*) FROM lemmas").fetchone()[0]
+        meta = {
+            "schema_version": SCHEMA_VERSION,
+            "source_name": os.path.basename(csv_path),
+            "source_sha256": source_sha256,
+            "ecdict_version": version or "",
+            "entries": str(entries),
+            "lemmas": str(lemmas),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        conn.executemany("INSERT INTO meta (name, value) VALUES (?, ?)", meta.items())
+        conn.commit()
+
+        logger.info("Running ANALYZE and VACUUM...")
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+    logger.info(f"Built {db_path}: {meta['entries']} entries, "
+                f"{os.path.getsize(db_path) / (1 << 20):.1f} MB in {time.time() - started:.1f}s")
+    return meta
+
+
+def _iter_image_records(conn: sqlite3.Connection) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Yield (key, record) pairs sorted by the UTF-8 key bytes, merging headwords
+    and inflected forms. SQLite's default BINARY collation sorts the same way.
+    """
+    entries = conn.execute("SELECT key, word, phonetic, meanings FROM entries ORDER BY key")
+    lemmas = conn.execute("SELECT form, lemma FROM lemmas ORDER BY form")
+
+    next_lemma = lemmas.fetchone()
+    current_key = None
+    record: Dict = {}
+
+    def finish(key: str, record: Dict) -> Tuple[bytes, bytes]:
+        return key.encode("utf-8"), json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    for key, word, phonetic, meanings in entries:
+        if key != current_key:
+            if current_key is not None:
+                yield finish(current_key, record)
+            # Inflected forms that are not headwords themselves
+            while next_lemma and next_lemma[0] < key:
+                yield finish(next_lemma[0], {"l": next_lemma[1]})
+                next_lemma = lemmas.fetchone()
+            current_key = key
+            record = {"e": []}
+            if next_lemma and next_lemma[0] == key:
+                record["l"] = next_lemma[1]
+                next_lemma = lemmas.fetchone()
+        record["e"].append([word, phonetic or "", json.loads(meanings) if meanings else []])
+
+    if current_key is not None:
+        yield finish(current_key, record)
+    while next_lemma:
+        yield finish(next_lemma[0], {"l": next_lemma[1]})
+        next_lemma = lemmas.fetchone()
+
+
+def build_image(db_path: str, image_path: str) -> int:
+    """
+    Write the compact read-only image served through mmap by ecdict_service.
+
+    Layout: header | meta JSON | string pool | index.
+    The pool holds each key followed by its record (JSON: headword spellings
+    with phonetic and pre-parsed meanings, plus 'l' = lemma for inflections).
+    The index is one (key offset, key length, record offset, record length)
+    uint32 quadruple per key, sorted by key, for binary search.
+    """
+    if sys.byteorder != "little":
+        raise RuntimeError("The dictionary image is written in little-endian order")
+
+    started = time.time()
+    tmp_path = f"{image_path}.building"
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        meta = read_meta(conn)
+        if meta.get("schema_version") != SCHEMA_VERSION:
+            raise RuntimeError(f"{db_path} is not a schema {SCHEMA_VERSION} build, run 'build' first")
+        meta_bytes = json.dumps(meta).encode("utf-8")
+
+        index = array("I")
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * IMAGE_HEADER.size)
+            meta_offset = f.tell()
+            f.write(meta_bytes)
+            pool_offset = f.tell()
+
+            position = 0
+            for key, record in _iter_image_records(conn):
+                f.write(key)
+                f.write(record)
+                index.extend((position, len(key), position + len(key), len(record)))
+                position += len(key) + len(record)
+                if position >= 1 << 32:
+                    raise RuntimeError("Dictionary image string pool exceeds 4 GB")
+
+            index_offset = f.tell()
+            index.tofile(f)
+            count = len(index) // 4
+
+            f.seek(0)
+            f.write(IMAGE_HEADER.pack(
+                IMAGE_MAGIC, IMAGE_FORMAT_VERSION, count,
+                index_offset, pool_offset, meta_offset, len(meta_bytes)
+            ))
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, image_path)
+    logger.info(f"Built {image_path}: {count} keys, "
+                f"{os.path.getsize(image_path) / (1 << 20):.1f} MB in {time.time() - started:.1f}s")
+    return count
@@ -4,12 +4,32 @@ Provides fast local English-Chinese dictionary lookups using ECDICT database.
 """
 import sqlite3
 from typing import Optional, Dict, List
+import json
 import logging
+import mmap
 import os
+import struct
+import sys
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "ecdict.db")
+IMAGE_PATH = os.path.join(os.path.dirname(__file__), "..", "ecdict.img")
+
+# Bumped whenever ecdict_builder changes the table layout
+SCHEMA_VERSION = "2"
+
+# Which table layout the database at DB_PATH uses, set by verify_database()
+_layout: Optional[str] = None
+_verified = False
+
+# Compact image: magic, format version, key count, index/pool/meta offsets, meta length
+IMAGE_MAGIC = b"ECDI"
+IMAGE_FORMAT_VERSION = 1
+IMAGE_HEADER = struct.Struct("<4sIIQQQI")
+
+# Memory-mapped image, preferred over SQLite when present
+_image: Optional["DictionaryImage"] = None
 
 def parse_pos(pos_str: str) -> List[Dict]:
     """
@@ -35,112 +55,401 @@ def parse_pos(pos_str: str) -> List[Dict]:
     return pos_list
 
 
-async def fetch_ecdict_data(word: str) -> Optional[Dict]:
+def parse_translation(translation: str, pos_str: str) -> List[Dict]:
     """
-    Query ECDICT SQLite database for word definition.
-    Returns structured dictionary data compatible with our API.
+    Turn ECDICT's raw translation text into our meanings structure.
+    ECDICT format: "n. 释义1\\nn. 释义2\\nv. 释义3"
     """
-    if not os.path.exists(DB_PATH):
-        logger.error(f"ECDICT database not found at {DB_PATH}")
-        logger.error("Please download from: https://github.com/skywind3000/ECDICT/releases")
-        return None
-    
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Access columns by name
-        cursor = conn.cursor()
-        
-        # Query the word (case-insensitive)
-        cursor.execute("""
-            SELECT word, phonetic, translation, pos, collins, oxford, tag, bnc, frq
-            FROM stardict 
-            WHERE word = ? COLLATE NOCASE
-            LIMIT 1
-        """, (word.lower(),))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            logger.info(f"Word '{word}' not found in ECDICT")
-            return None
-        
-        # Parse the data
-        phonetic = row['phonetic'] or ""
-        translation = row['translation'] or ""
-        pos_str = row['pos'] or ""
-        
-        # Format phonetic (ECDICT uses /.../ format already)
-        if phonetic and not phonetic.startswith('/'):
-            phonetic = f"/{phonetic}/"
-        
-        # Parse POS and create meanings structure
-        pos_list = parse_pos(pos_str)
-        meanings = []
-        
-        if pos_list and translation:
-            # Split translation by newlines or semicolons
-            # ECDICT format: "n. 释义1\\nn. 释义2\\nv. 释义3"
-            trans_lines = translation.replace('\\n', '\n').split('\n')
-            
-            # Group translations by POS
-            current_pos = None
-            current_defs = []
-            
-            for line in trans_lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Check if line starts with POS marker (n., v., adj., etc.)
-                if '. ' in line[:10]:  # POS markers are usually at the start
-                    # Save previous group
-                    if current_pos and current_defs:
-                        meanings.append({
-                            "partOfSpeech": current_pos,
-                            "definitions": [{
-                                "definition": "; ".join(current_defs),
-                                "example": ""
-                            }]
-                        })
-                    
-                    # Start new group
-                    parts = line.split('. ', 1)
-                    if len(parts) == 2:
-                        current_pos = parts[0] + '.'
-                        current_defs = [parts[1]]
-                    else:
-                        current_defs.append(line)
+    pos_list = parse_pos(pos_str)
+    meanings = []
+
+    if pos_list and translation:
+        # Split translation by newlines or semicolons
+        trans_lines = translation.replace('\\n', '\n').split('\n')
+
+        # Group translations by POS
+        current_pos = None
+        current_defs = []
+
+        for line in trans_lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            # Check if line starts with POS marker (n., v., adj., etc.)
+            if '. ' in line[:10]:  # POS markers are usually at the start
+                # Save previous group
+                if current_pos and current_defs:
+                    meanings.append({
+                        "partOfSpeech": current_pos,
+                        "definitions": [{
+                            "definition": "; ".join(current_defs),
+                            "example": ""
+                        }]
+                    })
+
+                # Start new group
+                parts = line.split('. ', 1)
+                if len(parts) == 2:
+                    current_pos = parts[0] + '.'
+                    current_defs = [parts[1]]
                 else:
                     current_defs.append(line)
-            
-            # Add last group
-            if current_pos and current_defs:
-                meanings.append({
-                    "partOfSpeech": current_pos,
-                    "definitions": [{
-                        "definition": "; ".join(current_defs),
-                        "example": ""
-                    }]
-                })
-        
-        # Fallback: if no structured meanings, use raw translation
-        if not meanings and translation:
+            else:
+                current_defs.append(line)
+
+        # Add last group
+        if current_pos and current_defs:
             meanings.append({
-                "partOfSpeech": "general",
+                "partOfSpeech": current_pos,
                 "definitions": [{
-                    "definition": translation.replace('\\n', '; '),
+                    "definition": "; ".join(current_defs),
                     "example": ""
                 }]
             })
-        
+
+    # Fallback: if no structured meanings, use raw translation
+    if not meanings and translation:
+        meanings.append({
+            "partOfSpeech": "general",
+            "definitions": [{
+                "definition": translation.replace('\\n', '; '),
+                "example": ""
+            }]
+        })
+
+    return meanings
+
+
+def format_phonetic(phonetic: Optional[str]) -> str:
+    phonetic = phonetic or ""
+    # ECDICT uses /.../ format already
+    if phonetic and not phonetic.startswith('/'):
+        phonetic = f"/{phonetic}/"
+    return phonetic
+
+
+class DictionaryImage:
+    """
+    Read-only view of the image written by ecdict_builder.build_image.
+
+    The file is mmap'ed, so all worker processes share one page-cache copy
+    and lookups read keys and records straight from the mapping.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise RuntimeError("Dictionary image requires a little-endian host")
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_offset, pool_offset, meta_offset, meta_len = IMAGE_HEADER.unpack_from(self._mm, 0)
+        if magic != IMAGE_MAGIC or version != IMAGE_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a format {IMAGE_FORMAT_VERSION} dictionary image")
+        self.count = count
+        self.meta: Dict[str, str] = json.loads(self._mm[meta_offset:meta_offset + meta_len])
+        self._pool = pool_offset
+        # uint32 quadruples: key offset, key length, record offset, record length
+        self._index = memoryview(self._mm)[index_offset:index_offset + count * 16].cast("I")
+
+    def _key(self, i: int) -> bytes:
+        offset = self._pool + self._index[i * 4]
+        return self._mm[offset:offset + self._index[i * 4 + 1]]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> str:
+        # The image is a sequence of its sorted keys, so bisect can search it directly
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self._key(i).decode("utf-8")
+
+    def record(self, i: int) -> Dict:
+        offset = self._pool + self._index[i * 4 + 2]
+        return json.loads(self._mm[offset:offset + self._index[i * 4 + 3]])
+
+    def find(self, key: str) -> Optional[Dict]:
+        """
+        Binary search for a lowercase key; returns its decoded record.
+        """
+        target = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self._key(lo) != target:
+            return None
+        return self.record(lo)
+
+    def lookup(self, word: str) -> Optional[Dict]:
+        record = self.find(word.lower())
+        if not record or not record.get("e"):
+            return None
+        # Prefer the exact spelling, e.g. 'Polish' vs 'polish'
+        spelling, phonetic, meanings = next((e for e in record["e"] if e[0] == word), record["e"][0])
         return {
             "phonetic": phonetic,
             "audio_url": None,  # ECDICT doesn't provide audio URLs
             "meanings": meanings,
             "phonetics": []
         }
-        
+
+    def lemma(self, word: str) -> Optional[str]:
+        record = self.find(word.lower())
+        return record.get("l") if record else None
+
+
+def load_image() -> Optional[DictionaryImage]:
+    """
+    Map the compact image if one was built; the SQLite path is used otherwise.
+    """
+    global _image
+    _image = None
+    if not os.path.exists(IMAGE_PATH):
+        return None
+
+    try:
+        image = DictionaryImage(IMAGE_PATH)
+    except Exception as e:
+        logger.error(f"Dictionary image at {IMAGE_PATH} could not be loaded: {e}")
+        return None
+
+    if image.meta.get("schema_version") != SCHEMA_VERSION:
+        logger.error(f"Dictionary image schema {image.meta.get('schema_version')} does not match "
+                     f"expected {SCHEMA_VERSION}, please rebuild it")
+        return None
+    expected_sha = os.environ.get("ECDICT_SHA256")
+    if expected_sha and expected_sha.lower() != image.meta.get("source_sha256", "").lower():
+        logger.error(f"Dictionary image source checksum {image.meta.get('source_sha256')} does not match ECDICT_SHA256")
+        return None
+
+    logger.info(f"Dictionary image mapped: {image.count} keys from {IMAGE_PATH}")
+    _image = image
+    return _image
+
+
+def get_image() -> Optional[DictionaryImage]:
+    """
+    The mapped image, or None when lookups go through SQLite.
+    """
+    if not _verified:
+        verify_database()
+    return _image
+
+
+def _connect() -> sqlite3.Connection:
+    # The dictionary is never written by the service, open it read-only
+    conn = sqlite3.connect(f"file:{os.path.abspath(DB_PATH)}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row  # Access columns by name
+    return conn
+
+
+def read_meta(conn: sqlite3.Connection) -> Dict[str, str]:
+    """
+    Return the build metadata of a database produced by ecdict_builder,
+    or an empty dict for a plain stardict.db copied from the ECDICT release.
+    """
+    has_meta = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'"
+    ).fetchone()
+    if not has_meta:
+        return {}
+    return {row[0]: row[1] for row in conn.execute("SELECT name, value FROM meta")}
+
+
+def verify_database() -> bool:
+    """
+    Check the ECDICT database (and image, if any) at startup and remember
+    which layout it uses. Set ECDICT_SHA256 to pin the source checksum
+    a deployment expects.
+    """
+    global _layout, _verified
+    _layout = None
+    _verified = True
+    load_image()
+
+    if not os.path.exists(DB_PATH):
+        logger.warning(f"ECDICT database not found at {DB_PATH}, local dictionary disabled")
+        return False
+
+    try:
+        conn = _connect()
+        try:
+            meta = read_meta(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"ECDICT database at {DB_PATH} could not be opened: {e}")
+        return False
+
+    if not meta:
+        logger.warning("ECDICT database has no build metadata, using the slower stardict layout. "
+                       "Rebuild it with: python download_ecdict.py build <ecdict.csv>")
+        _layout = "stardict"
+        return True
+
+    if meta.get("schema_version") != SCHEMA_VERSION:
+        logger.error(f"ECDICT database schema {meta.get('schema_version')} does not match "
+                     f"expected {SCHEMA_VERSION}, please rebuild it")
+        return False
+
+    expected_sha = os.environ.get("ECDICT_SHA256")
+    if expected_sha and expected_sha.lower() != meta.get("source_sha256", "").lower():
+        logger.error(f"ECDICT source checksum {meta.get('source_sha256')} does not match ECDICT_SHA256")
+        return False
+
+    logger.info(f"ECDICT database ok: {meta.get('entries')} entries, source {meta.get('source_name')} "
+                f"(sha256 {meta.get('source_sha256', '')[:12]}), built {meta.get('built_at')}")
+    _layout = "entries"
+    return True
+
+
+def get_layout() -> Optional[str]:
+    """
+    'entries' for a built database, 'stardict' for a raw release copy, None if unusable.
+    """
+    if not _verified:
+        verify_database()
+    return _layout
+
+
+def _query_entries(conn: sqlite3.Connection, word: str) -> Optional[Dict]:
+    rows = conn.execute(
+        "SELECT word, phonetic, meanings FROM entries WHERE key = ?",
+        (word.lower(),)
+    ).fetchall()
+    if not rows:
+        return None
+
+    # Prefer the exact spelling, e.g. 'Polish' vs 'polish'
+    row = next((r for r in rows if r['word'] == word), rows[0])
+    return {
+        "phonetic": row['phonetic'] or "",
+        "audio_url": None,  # ECDICT doesn't provide audio URLs
+        "meanings": json.loads(row['meanings']) if row['meanings'] else [],
+        "phonetics": []
+    }
+
+
+def _query_stardict(conn: sqlite3.Connection, word: str) -> Optional[Dict]:
+    # Query the word (case-insensitive)
+    row = conn.execute("""
+        SELECT word, phonetic, translation, pos, collins, oxford, tag, bnc, frq
+        FROM stardict
+        WHERE word = ? COLLATE NOCASE
+        LIMIT 1
+    """, (word.lower(),)).fetchone()
+
+    if not row:
+        return None
+
+    return {
+        "phonetic": format_phonetic(row['phonetic']),
+        "audio_url": None,  # ECDICT doesn't provide audio URLs
+        "meanings": parse_translation(row['translation'] or "", row['pos'] or ""),
+        "phonetics": []
+    }
+
+
+def _lemma_from_entries(conn: sqlite3.Connection, word: str) -> Optional[str]:
+    row = conn.execute("SELECT lemma FROM lemmas WHERE form = ?", (word.lower(),)).fetchone()
+    return row['lemma'] if row else None
+
+
+def _lemma_from_stardict(conn: sqlite3.Connection, word: str) -> Optional[str]:
+    # Release copies have no lemma index; fall back to the form's own '0:' entry
+    row = conn.execute(
+        "SELECT exchange FROM stardict WHERE word = ? COLLATE NOCASE LIMIT 1",
+        (word.lower(),)
+    ).fetchone()
+    if not row or not row['exchange']:
+        return None
+    parts = dict(part.split(':', 1) for part in row['exchange'].split('/') if ':' in part)
+    # A form with inflections of its own ('saw' -> 'sawed') is a word in its own right
+    if any(kind in parts for kind in ("p", "d", "i", "3", "r", "t", "s")):
+        return None
+    return parts.get("0") or None
+
+
+async def resolve_lemma(word: str) -> Optional[str]:
+    """
+    Map an inflected form to its lemma ('running' -> 'run', 'mice' -> 'mouse').
+    Returns None when the word is not a known inflection.
+    """
+    if _image:
+        lemma = _image.lemma(word)
+        return lemma if lemma and lemma.lower() != word.lower() else None
+
+    layout = get_layout()
+    if not layout:
+        return None
+
+    try:
+        conn = _connect()
+        try:
+            if layout == "entries":
+                lemma = _lemma_from_entries(conn, word)
+            else:
+                lemma = _lemma_from_stardict(conn, word)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"ECDICT lemma lookup failed: {e}")
+        return None
+
+    if lemma and lemma.lower() != word.lower():
+        return lemma
+    return None
+
+
+async def fetch_ecdict_data(word: str) -> Optional[Dict]:
+    """
+    Query ECDICT SQLite database for word definition.
+    Returns structured dictionary data compatible with our API.
+    """
+    layout = get_layout()
+
+    if _image:
+        result = _image.lookup(word)
+        if not result:
+            # Fall back to the lemma of an inflected form
+            lemma = _image.lemma(word)
+            if lemma and lemma.lower() != word.lower():
+                result = _image.lookup(lemma)
+                if result:
+                    result["lemma"] = lemma
+        if not result:
+            logger.info(f"Word '{word}' not found in ECDICT")
+        return result
+
+    if not layout:
+        logger.error(f"ECDICT database not available at {DB_PATH}")
+        logger.error("Please build it with: python download_ecdict.py build <ecdict.csv>")
+        return None
+
+    try:
+        conn = _connect()
+        try:
+            query = _query_entries if layout == "entries" else _query_stardict
+            result = query(conn, word)
+
+            if not result:
+                # Fall back to the lemma of an inflected form
+                lemma = _lemma_from_entries(conn, word) if layout == "entries" else _lemma_from_stardict(conn, word)
+                if lemma and lemma.lower() != word.lower():
+                    result = query(conn, lemma)
+                    if result:
+                        result["lemma"] = lemma
+        finally:
+            conn.close()
+
+        if not result:
+            logger.info(f"Word '{word}' not found in ECDICT")
+        return result
+
     except Exception as e:
         logger.error(f"ECDICT query failed: {e}")
         return None
@@ -1,24 +1,272 @@
+import asyncio
+import contextvars
 import logging
-from typing import Dict, Any
+import os
+import re
+import threading
+from contextlib import AsyncExitStack
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Tuple
 from fastapi.concurrency import run_in_threadpool
-from app.llm_service import get_llm_service
+from app.deadline import DeadlineExceeded, within, note_timeout
+from app.cache import cache, cache_key, negative_cache_key, SENTENCE_TTL, PROVIDER_TTL, NEGATIVE_TTL, FAILURE_TTL
+from app.json_stream import DictionaryStreamParser
+from app.llm_scheduler import llm_scheduler
+from app.llm_service import get_llm_service, llm_manager
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# Texts at least this long are split into sentences and translated concurrently (0 disables)
+SENTENCE_SPLIT_MIN_CHARS = int(os.environ.get("SENTENCE_SPLIT_MIN_CHARS", "200"))
+
+# Sentence end punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r'[.!?…。！？]+["\'”’)\]]*(\s+)')
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "no", "fig", "inc", "ltd", "co"}
+# Target languages written without spaces between sentences
+NO_SPACE_LANGUAGES = {"Chinese", "Traditional Chinese", "Japanese"}
+
+class LookupFailed(Exception):
+    """
+    A word lookup that produced no usable result. `not_found` means the
+    provider answered but had no meanings (typos, gibberish); otherwise
+    the provider failed. Not found is remembered for NEGATIVE_TTL seconds,
+    failures for the much shorter FAILURE_TTL.
+    """
+
+    def __init__(self, word: str, reason: str, not_found: bool = False):
+        super().__init__(f"No result for '{word}': {reason}")
+        self.word = word
+        self.reason = reason
+        self.not_found = not_found
+
 def is_single_word(text: str) -> bool:
     return len(text.strip().split()) == 1
 
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+    """
+    Split text into (sentence, following whitespace) pairs.
+    Joining all pairs gives back the original text.
+    """
+    parts = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        end = match.start(1)
+        last_word = text[start:end].rsplit(None, 1)[-1].rstrip('.').lower() if text[start:end].strip() else ""
+        next_char = text[match.end():match.end() + 1]
+        # 'Dr. Smith', 'e.g. this' and single initials ('J. Doe') are not boundaries
+        if "\n" not in match.group(1):
+            if last_word in ABBREVIATIONS or len(last_word) == 1 or next_char.islower():
+                continue
+        parts.append((text[start:end], match.group(1)))
+        start = match.end()
+    if start < len(text):
+        parts.append((text[start:], ""))
+    return parts
+
+def extract_simple_translation(data: Dict[str, Any], fallback: str) -> str:
+    """
+    Pick a short translation (the first definition) out of a lookup_word result.
+    """
+    simple_translation = data.get("word", fallback)
+    meanings = data.get("meanings", [])
+
+    if isinstance(meanings, list) and len(meanings) > 0:
+        first_meaning = meanings[0]
+        if isinstance(first_meaning, dict):
+            defs = first_meaning.get("definitions", [])
+            if isinstance(defs, list) and len(defs) > 0:
+                first_def = defs[0]
+                if isinstance(first_def, dict):
+                    simple_translation = first_def.get("definition", simple_translation)
+                elif isinstance(first_def, str):
+                    # Fallback if the LLM returns a simple string list
+                    simple_translation = first_def
+
+    return simple_translation
+
 def _lookup_word_sync(word: str, target_lang: str = "Chinese") -> Dict[str, Any]:
     service = get_llm_service()
     return service.lookup_word(word, target_lang)
 
+def _lookup_words_sync(words: List[str], target_lang: str = "Chinese") -> Dict[str, Dict[str, Any]]:
+    service = get_llm_service()
+    return service.lookup_words(words, target_lang)
+
 def _translate_sentence_sync(sentence: str, target_lang: str = "Chinese") -> str:
     service = get_llm_service()
     return service.translate_sentence(sentence, target_lang)
 
-async def lookup_word(word: str, target_lang: str = "Chinese") -> Dict[str, Any]:
-    return await run_in_threadpool(_lookup_word_sync, word, target_lang)
+def _provider_key(word: str, target_lang: str) -> str:
+    # Provider results are shared across workers; a new model or prompt starts fresh
+    version = llm_manager.provenance()
+    return cache_key("llm", version["provider"], version["llm_model"], version["prompt_version"], target_lang, word)
+
+def _miss_key(word: str, target_lang: str) -> str:
+    return negative_cache_key("llm", llm_manager.default_service_name, target_lang, word)
+
+async def _check_miss(word: str, target_lang: str):
+    miss = await cache.get(_miss_key(word, target_lang))
+    if miss is not None:
+        raise LookupFailed(word, miss["reason"], miss["not_found"])
+
+async def _record_miss(word: str, target_lang: str, reason: str, not_found: bool = False) -> LookupFailed:
+    ttl = NEGATIVE_TTL if not_found else FAILURE_TTL
+    await cache.set(_miss_key(word, target_lang), {"reason": reason[:200], "not_found": not_found}, ttl)
+    return LookupFailed(word, reason, not_found)
+
+async def clear_miss(word: str, target_lang: str = "Chinese"):
+    await cache.invalidate(_miss_key(word, target_lang))
+
+async def _call_llm(func: Callable, *args) -> Any:
+    """
+    Run a blocking provider call in a scheduler slot, waiting for at most
+    what is left of the request deadline (queueing included).
+    """
+    async def call():
+        async with llm_scheduler.slot():
+            return await run_in_threadpool(func, *args)
+    return await within("llm", call())
+
+def _has_meanings(data: Any) -> bool:
+    return isinstance(data, dict) and isinstance(data.get("meanings"), list) and len(data["meanings"]) > 0
+
+async def lookup_word(word: str, target_lang: str = "Chinese", skip_misses: bool = False) -> Dict[str, Any]:
+    """
+    Raises LookupFailed when the provider fails or knows no meanings;
+    repeats within NEGATIVE_TTL (FAILURE_TTL after a provider failure)
+    fail fast unless `skip_misses` is set.
+    """
+    key = _provider_key(word, target_lang)
+    cached = await cache.get(key)
+    if cached is not None:
+        return cached
+    if not skip_misses:
+        await _check_miss(word, target_lang)
+
+    try:
+        data = await _call_llm(_lookup_word_sync, word, target_lang)
+    except DeadlineExceeded:
+        # Out of time is not a property of the word, don't remember it
+        raise
+    except Exception as e:
+        timed_out = note_timeout("llm")
+        if timed_out:
+            raise timed_out from e
+        raise await _record_miss(word, target_lang, str(e)) from e
+    if not _has_meanings(data):
+        raise await _record_miss(word, target_lang, "no meanings", not_found=True)
+
+    await cache.set(key, data, PROVIDER_TTL)
+    return data
+
+async def _iterate_in_thread(make_iterator: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+    """
+    Consume a blocking iterator in a worker thread, handing items to the loop.
+    Stops the thread at the next item if the consumer goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in make_iterator():
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    # run_in_executor doesn't carry contextvars; the provider reads the request deadline from them
+    loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await within("llm", queue.get())
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Don't wait for the thread, it exits at its next item
+        stopped.set()
+
+async def stream_lookup_word(word: str, target_lang: str = "Chinese") -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yield ('word' | 'phonetic', str) and ('meaning', dict) events while the
+    provider generates, then ('result', data) with the validated document.
+    """
+    key = _provider_key(word, target_lang)
+    cached = await cache.get(key)
+    if cached is not None:
+        yield "result", cached
+        return
+    await _check_miss(word, target_lang)
+
+    parser = DictionaryStreamParser()
+    try:
+        async with AsyncExitStack() as stack:
+            await within("llm", stack.enter_async_context(llm_scheduler.slot()))
+            service = get_llm_service()
+            async for chunk in _iterate_in_thread(lambda: service.stream_lookup_word(word, target_lang)):
+                for event in parser.feed(chunk):
+                    yield event
+        data = parser.document()
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        timed_out = note_timeout("llm")
+        if timed_out:
+            raise timed_out from e
+        raise await _record_miss(word, target_lang, str(e)) from e
+    if not _has_meanings(data):
+        raise await _record_miss(word, target_lang, "no meanings", not_found=True)
+    await cache.set(key, data, PROVIDER_TTL)
+    yield "result", data
+
+async def lookup_words(words: List[str], target_lang: str = "Chinese") -> Dict[str, Dict[str, Any]]:
+    return await _call_llm(_lookup_words_sync, words, target_lang)
+
+async def _translate_one(sentence: str, target_lang: str) -> str:
+    key = cache_key("sentence", target_lang, sentence.strip())
+    cached = await cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        translation = await _call_llm(_translate_sentence_sync, sentence, target_lang)
+    except DeadlineExceeded:
+        # Out of time: the sentence stays untranslated, like a provider failure
+        return sentence
+
+    # Providers return the input unchanged on failure, don't cache that
+    if translation and translation != sentence:
+        await cache.set(key, translation, SENTENCE_TTL)
+    return translation
 
 async def translate_sentence(sentence: str, target_lang: str = "Chinese") -> str:
-    return await run_in_threadpool(_translate_sentence_sync, sentence, target_lang)
+    if SENTENCE_SPLIT_MIN_CHARS <= 0 or len(sentence) < SENTENCE_SPLIT_MIN_CHARS:
+        return await _translate_one(sentence, target_lang)
+
+    parts = split_sentences(sentence)
+    if len(parts) < 2:
+        return await _translate_one(sentence, target_lang)
+
+    # Cached sentences return immediately, the rest run under the concurrency limit
+    translations = await asyncio.gather(*(_translate_one(text, target_lang) for text, _ in parts))
+    logger.info(f"Translated {len(parts)} sentences concurrently")
+
+    result = []
+    # Untranslated sentences (failures, deadline) keep their original spacing
+    untranslated = [translation == text for translation, (text, _) in zip(translations, parts)] + [False]
+    for i, (translation, (_, separator)) in enumerate(zip(translations, parts)):
+        result.append(translation)
+        if "\n" in separator or (separator and (untranslated[i] or untranslated[i + 1])):
+            result.append(separator)
+        elif separator:
+            result.append("" if target_lang in NO_SPACE_LANGUAGES else " ")
+    return "".join(result)
@@ -0,0 +1,221 @@
+"""
+Page Highlight Service
+Finds the user's saved words in page text with an Aho-Corasick automaton
+built from the starred and learned Word rows.
+
+Each worker keeps its own index. A worker that changes a word updates
+its index in place and signals the others through the cache's pub/sub
+channel; they reload from the database on their next request.
+"""
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session, or_, select
+from app.cache import cache
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+# A word, allowing inner apostrophes and hyphens ("don't", "ice-cream")
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+
+# Cache signal sent to the other workers when a highlighted word changed
+HIGHLIGHT_SIGNAL = "highlight"
+
+
+def _lower_same_length(text: str) -> str:
+    """
+    Lowercase text without changing its length, so offsets stay valid
+    ('İ'.lower() is two characters; such characters are kept as-is).
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class HighlightIndex:
+    """
+    Aho-Corasick automaton over saved words.
+
+    The alphabet is word tokens rather than characters: the regex tokenizer
+    does the character scanning, matches always fall on word boundaries and
+    multi-word entries ("ice cream") are token sequences. Words are inserted into (or unmarked in) the trie as they are starred and
+    unstarred; failure links are recomputed lazily on the next match.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        # Trie: per node, outgoing edges by token, failure link, nearest terminal suffix
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._dict_link: List[int] = [0]
+        # Key of the word ending at the node, or None
+        self._terminal: List[Optional[str]] = [None]
+        # Number of tokens of the word ending at the node
+        self._depth: List[int] = [0]
+        # Key (lowercased tokens joined by spaces) -> word id -> (original spelling, learned).
+        # Rows of several languages can share a key; the most recently synced one is reported.
+        self._words: Dict[str, Dict[uuid.UUID, Tuple[str, bool]]] = {}
+        self._dirty = True
+
+    @staticmethod
+    def _tokens(original: str) -> List[str]:
+        return TOKEN_PATTERN.findall(_lower_same_length(original))
+
+    def _key(self, original: str) -> str:
+        return " ".join(self._tokens(original))
+
+    def load(self, session: Session):
+        """
+        (Re)build the automaton from all starred and learned words.
+        """
+        t0 = time.time()
+        rows = session.exec(
+            select(Word.id, Word.original, Word.learned).where(or_(Word.star == True, Word.learned == True))
+        ).all()
+        with self._lock:
+            self._reset()
+            for word_id, original, learned in rows:
+                self._add(word_id, original, learned)
+            self._build_links()
+            self._loaded = True
+        logger.info(f"Highlight index built: {len(self._words)} words, {len(self._goto)} nodes in {time.time() - t0:.3f}s")
+
+    def ensure_loaded(self, session: Session):
+        if not self._loaded:
+            self.load(session)
+
+    def invalidate(self):
+        """
+        Reload from the database on the next request, after another worker changed words.
+        """
+        with self._lock:
+            self._loaded = False
+
+    def _add(self, word_id: uuid.UUID, original: str, learned: bool):
+        key = self._key(original)
+        if not key:
+            return
+        rows = self._words.get(key)
+        if rows is None:
+            node = 0
+            for token in key.split(" "):
+                next_node = self._goto[node].get(token)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._dict_link.append(0)
+                    self._terminal.append(None)
+                    self._depth.append(self._depth[node] + 1)
+                    self._goto[node][token] = next_node
+                node = next_node
+            self._terminal[node] = key
+            self._dirty = True
+            rows = self._words[key] = {}
+        rows.pop(word_id, None)
+        rows[word_id] = (original, learned)
+
+    def _remove(self, word_id: uuid.UUID, original: str):
+        key = self._key(original)
+        rows = self._words.get(key)
+        if rows is None or rows.pop(word_id, None) is None or rows:
+            return
+        del self._words[key]
+        node = 0
+        for token in key.split(" "):
+            node = self._goto[node][token]
+        # The trie path stays; it just no longer produces a match
+        self._terminal[node] = None
+        self._dirty = True
+
+    def sync_word(self, word: Word, previous_original: Optional[str] = None):
+        """
+        Reflect a changed Word row. No-op until the index has been loaded.
+        """
+        cache.signal(HIGHLIGHT_SIGNAL)
+        with self._lock:
+            if not self._loaded:
+                return
+            if previous_original and previous_original != word.original:
+                self._remove(word.id, previous_original)
+            if word.star or word.learned:
+                self._add(word.id, word.original, word.learned)
+            else:
+                self._remove(word.id, word.original)
+
+    def _build_links(self):
+        # Breadth-first, so every node's failure target is already linked
+        queue = []
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._dict_link[child] = 0
+            queue.append(child)
+
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(token, 0)
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._terminal[fail] else self._dict_link[fail]
+                queue.append(child)
+        self._dirty = False
+
+    def match(self, text: str) -> List[Dict]:
+        """
+        Return whole-word matches of saved words in `text` as character offsets.
+        """
+        # Lowercasing must keep offsets valid for the original text
+        lowered = _lower_same_length(text)
+        spans = [m.span() for m in TOKEN_PATTERN.finditer(lowered)]
+        matches = []
+        with self._lock:
+            if self._dirty:
+                self._build_links()
+            goto, fail, dict_link, terminal, depth, words = (
+                self._goto, self._fail, self._dict_link, self._terminal, self._depth, self._words
+            )
+
+            state = 0
+            for i, (start, end) in enumerate(spans):
+                token = lowered[start:end]
+                next_state = goto[state].get(token)
+                while next_state is None and state:
+                    state = fail[state]
+                    next_state = goto[state].get(token)
+                state = next_state or 0
+                if not state:
+                    continue
+
+                node = state if terminal[state] else dict_link[state]
+                while node:
+                    word_id, (original, learned) = next(reversed(words[terminal[node]].items()))
+                    matches.append({
+                        "start": spans[i - depth[node] + 1][0],
+                        "end": end,
+                        "word_id": word_id,
+                        "word": original,
+                        "learned": learned
+                    })
+                    node = dict_link[node]
+
+        matches.sort(key=lambda m: (m["start"], -m["end"]))
+        return matches
+
+
+# Global instance, shared by all requests of this worker
+highlight_index = HighlightIndex()
+cache.on_signal(HIGHLIGHT_SIGNAL, highlight_index.invalidate)
@@ -0,0 +1,107 @@
+"""
+Incremental JSON parsing for streamed dictionary lookups.
+Scans the model output as it arrives and reports top-level string fields
+and each `meanings` entry as soon as its closing bracket is seen.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+# Top-level string fields reported as soon as they are complete
+STRING_FIELDS = ("word", "phonetic")
+
+
+class _Container:
+    __slots__ = ("kind", "key", "expecting_key", "start")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind          # '{' or '['
+        self.key: Optional[str] = None
+        self.expecting_key = kind == "{"
+        self.start = start
+
+
+class DictionaryStreamParser:
+    """
+    Feed text chunks of a DICTIONARY_PROMPT_TEMPLATE answer; `feed` returns
+    (event, value) pairs: ('word' | 'phonetic', str) and ('meaning', dict).
+    Anything before the first '{' (e.g. a ```json fence) and after the
+    closing '}' is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._stack: List[_Container] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self.complete = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.complete:
+            return []
+        if not self._started:
+            self._buffer += chunk
+            brace = self._buffer.find("{")
+            if brace < 0:
+                # Keep a short tail only; nothing useful before the document
+                self._buffer = self._buffer[-16:]
+                return []
+            self._buffer = self._buffer[brace:]
+            self._started = True
+        else:
+            self._buffer += chunk
+        return self._scan()
+
+    def _in_meanings(self) -> bool:
+        # Directly inside the top-level 'meanings' array
+        return len(self._stack) == 2 and self._stack[1].kind == "[" and self._stack[0].key == "meanings"
+
+    def _scan(self) -> List[Tuple[str, Any]]:
+        events = []
+        buffer, stack = self._buffer, self._stack
+        i = self._pos
+        while i < len(buffer):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    top = stack[-1]
+                    value = json.loads(buffer[self._string_start:i + 1])
+                    if top.kind == "{" and top.expecting_key:
+                        top.key = value
+                        top.expecting_key = False
+                    elif len(stack) == 1 and top.key in STRING_FIELDS:
+                        events.append((top.key, value))
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                stack.append(_Container(c, i))
+            elif c in "}]":
+                closed = stack.pop()
+                if self._in_meanings() and closed.kind == "{":
+                    events.append(("meaning", json.loads(buffer[closed.start:i + 1])))
+                if not stack:
+                    self.complete = True
+                    self._buffer = buffer[:i + 1]
+                    self._pos = i + 1
+                    return events
+            elif c == "," and stack[-1].kind == "{":
+                stack[-1].expecting_key = True
+            i += 1
+        self._pos = i
+        return events
+
+    def document(self) -> Any:
+        """
+        The complete parsed document; raises ValueError if it never closed.
+        """
+        if not self.complete:
+            raise ValueError("Incomplete JSON document in model output")
+        return json.loads(self._buffer)
@@ -0,0 +1,53 @@
+"""
+Target Languages
+The API, Word rows and cache keys use language codes ('zh', 'ja', 'ko');
+prompts are written with the language name.
+"""
+from typing import Optional
+
+DEFAULT_LANGUAGE = "zh"
+
+LANGUAGE_NAMES = {
+    "zh": "Chinese",
+    "zh-tw": "Traditional Chinese",
+    "ja": "Japanese",
+    "ko": "Korean",
+    "vi": "Vietnamese",
+    "th": "Thai",
+    "id": "Indonesian",
+    "fr": "French",
+    "de": "German",
+    "es": "Spanish",
+    "pt": "Portuguese",
+    "it": "Italian",
+    "ru": "Russian",
+    "ar": "Arabic",
+}
+
+# Regional tags that select a different written language
+LANGUAGE_ALIASES = {
+    "zh-hant": "zh-tw",
+    "zh-hk": "zh-tw",
+    "zh-mo": "zh-tw",
+    "zh-hans": "zh",
+}
+
+
+def normalize_language(code: Optional[str]) -> str:
+    """
+    Map a language tag to a supported code: 'zh-CN' -> 'zh', 'zh-Hant' -> 'zh-tw'.
+    Raises ValueError for unsupported languages.
+    """
+    if not code:
+        return DEFAULT_LANGUAGE
+    tag = code.strip().lower().replace("_", "-")
+    tag = LANGUAGE_ALIASES.get(tag, tag)
+    if tag not in LANGUAGE_NAMES:
+        tag = tag.split("-")[0]
+    if tag not in LANGUAGE_NAMES:
+        raise ValueError(f"Unsupported target language '{code}', expected one of {', '.join(LANGUAGE_NAMES)}")
+    return tag
+
+
+def language_name(code: Optional[str]) -> str:
+    return LANGUAGE_NAMES[normalize_language(code)]
@@ -0,0 +1,156 @@
+"""
+LLM Scheduler
+Every provider call takes a slot from one scheduler per process. Callers
+are ranked by priority class, so a user waiting on a popup is served
+before starring, which is served before batch work:
+
+    interactive  /translate lookups (the default)
+    user         starring words, subtitle tracks
+    background   pre-warming, refresh and retry workers
+
+Each class may only use its share of the LLM_MAX_CONCURRENCY slots,
+which keeps capacity free for higher classes even while batch work runs.
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional, Tuple
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+USER = "user"
+BACKGROUND = "background"
+# Highest priority first
+PRIORITIES = (INTERACTIVE, USER, BACKGROUND)
+
+# Maximum LLM calls in flight per process, shared by all classes
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+# Share of the slots each class may occupy at once, e.g. "interactive=1,user=0.75,background=0.5"
+LLM_PRIORITY_SHARES = os.environ.get("LLM_PRIORITY_SHARES", "interactive=1,user=0.75,background=0.5")
+
+queue_seconds = metrics.histogram(
+    "llm_queue_seconds", "Time LLM calls waited for a slot", ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+queue_depth = metrics.gauge("llm_queue_depth", "LLM calls waiting for a slot", ["priority"])
+in_flight_gauge = metrics.gauge("llm_in_flight", "LLM calls running", ["priority"])
+
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def parse_shares(spec: str) -> Dict[str, float]:
+    shares = {priority: 1.0 for priority in PRIORITIES}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in shares:
+            raise ValueError(f"Unknown LLM priority class '{name}', expected one of {', '.join(PRIORITIES)}")
+        shares[name] = float(value)
+    return shares
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """
+    Run the enclosed LLM calls (and tasks started inside) at `priority`.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority class '{priority}'")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class LLMScheduler:
+    def __init__(self, capacity: int = LLM_MAX_CONCURRENCY, shares: Optional[Dict[str, float]] = None):
+        self.capacity = max(capacity, 1)
+        shares = shares or parse_shares(LLM_PRIORITY_SHARES)
+        # Every class can always run at least one call
+        self.limits = {p: max(1, min(self.capacity, math.floor(self.capacity * shares[p]))) for p in PRIORITIES}
+        self.in_flight = {p: 0 for p in PRIORITIES}
+        self._waiters: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {p: deque() for p in PRIORITIES}
+
+    def _total(self) -> int:
+        return sum(self.in_flight.values())
+
+    def _can_start(self, priority: str) -> bool:
+        if self._total() >= self.capacity or self.in_flight[priority] >= self.limits[priority]:
+            return False
+        if self._waiters[priority]:
+            return False
+        # Don't overtake waiting callers of a higher class that could take this slot
+        for p in PRIORITIES[:PRIORITIES.index(priority)]:
+            if self._waiters[p] and self.in_flight[p] < self.limits[p]:
+                return False
+        return True
+
+    def _start(self, priority: str, waited: float):
+        self.in_flight[priority] += 1
+        in_flight_gauge.set(self.in_flight[priority], priority=priority)
+        queue_seconds.observe(waited, priority=priority)
+
+    def _dispatch(self):
+        """
+        Hand free slots to waiters, highest class first.
+        """
+        progressed = True
+        while progressed and self._total() < self.capacity:
+            progressed = False
+            for priority in PRIORITIES:
+                waiters = self._waiters[priority]
+                if waiters and self.in_flight[priority] < self.limits[priority]:
+                    future, queued_at = waiters.popleft()
+                    queue_depth.set(len(waiters), priority=priority)
+                    self._start(priority, time.monotonic() - queued_at)
+                    future.set_result(None)
+                    progressed = True
+                    break
+
+    def _release(self, priority: str):
+        self.in_flight[priority] -= 1
+        in_flight_gauge.set(self.in_flight[priority], priority=priority)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        """
+        Hold one LLM slot for the duration of the block.
+        """
+        priority = priority or _current_priority.get()
+        if self._can_start(priority):
+            self._start(priority, 0.0)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            waiter = (future, time.monotonic())
+            waiters = self._waiters[priority]
+            waiters.append(waiter)
+            queue_depth.set(len(waiters), priority=priority)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was granted just before the caller went away
+                    self._release(priority)
+                else:
+                    waiters.remove(waiter)
+                    queue_depth.set(len(waiters), priority=priority)
+                raise
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+
+# Global instance, shared by all LLM calls of this worker
+llm_scheduler = LLMScheduler()
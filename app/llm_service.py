@@ -1,12 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List
 import os
 import json
 import re
 import logging
 from google import genai
 from openai import OpenAI
-from app.prompts import DICTIONARY_PROMPT_TEMPLATE, TRANSLATE_PROMPT_TEMPLATE
+from app.deadline import LLM_TIMEOUT, remaining, timeout_for
+from app.prompts import (
+    DICTIONARY_PROMPT_TEMPLATE, DICTIONARY_PROMPT_VERSION, BATCH_DICTIONARY_PROMPT_TEMPLATE, TRANSLATE_PROMPT_TEMPLATE
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +22,27 @@ class LLMService(ABC):
     def translate_sentence(self, sentence: str, target_lang: str) -> str:
         pass
 
+    def lookup_words(self, words: List[str], target_lang: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up several words at once. Returns a dict keyed by input word;
+        words the provider could not resolve are simply missing.
+        Providers override this with a single batched prompt.
+        """
+        results = {}
+        for word in words:
+            try:
+                results[word] = self.lookup_word(word, target_lang)
+            except Exception:
+                continue
+        return results
+
+    def stream_lookup_word(self, word: str, target_lang: str) -> Iterator[str]:
+        """
+        Yield the raw JSON text of a lookup_word answer as it is generated.
+        Providers without streaming yield the whole document at once.
+        """
+        yield json.dumps(self.lookup_word(word, target_lang), ensure_ascii=False)
+
 class GeminiService(LLMService):
     def __init__(self):
         api_key = os.environ.get("GOOGLE_API_KEY")
@@ -29,6 +53,11 @@ class GeminiService(LLMService):
             logger.error(f"Failed to initialize Gemini client: {e}")
             self.client = None
 
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        # Bounded by what is left of the request deadline
+        return {"temperature": 0, "http_options": {"timeout": int(timeout_for(LLM_TIMEOUT) * 1000)}}
+
     def lookup_word(self, word: str, target_lang: str) -> Dict[str, Any]:
         if not self.client:
             raise RuntimeError("Gemini client not initialized")
@@ -38,7 +67,7 @@ class GeminiService(LLMService):
             response = self.client.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config={"temperature": 0},
+                config=self._config(),
             )
             text = response.text.strip()
             text = re.sub(r"```json|```", "", text).strip()
@@ -47,6 +76,41 @@ class GeminiService(LLMService):
             logger.error(f"Gemini lookup_word failed: {e}")
             raise e
 
+    def stream_lookup_word(self, word: str, target_lang: str) -> Iterator[str]:
+        if not self.client:
+            raise RuntimeError("Gemini client not initialized")
+
+        prompt = DICTIONARY_PROMPT_TEMPLATE.format(target_lang=target_lang, word=word)
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=prompt,
+                config=self._config(),
+            ):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Gemini stream_lookup_word failed: {e}")
+            raise e
+
+    def lookup_words(self, words: List[str], target_lang: str) -> Dict[str, Dict[str, Any]]:
+        if not self.client:
+            raise RuntimeError("Gemini client not initialized")
+
+        prompt = BATCH_DICTIONARY_PROMPT_TEMPLATE.format(target_lang=target_lang, words="\n".join(words))
+        try:
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._config(),
+            )
+            text = response.text.strip()
+            text = re.sub(r"```json|```", "", text).strip()
+            return json.loads(text)
+        except Exception as e:
+            logger.error(f"Gemini lookup_words failed: {e}")
+            raise e
+
     def translate_sentence(self, sentence: str, target_lang: str) -> str:
         if not self.client:
             raise RuntimeError("Gemini client not initialized")
@@ -56,7 +120,7 @@ class GeminiService(LLMService):
             response = self.client.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config={"temperature": 0},
+                config=self._config(),
             )
             return response.text.strip()
         except Exception as e:
@@ -81,10 +145,16 @@ class OpenRouterService(LLMService):
         # self.model = "meta-llama/llama-3.3-70b-instruct:free"
         # self.model = "qwen/qwen3-4b:free"
 
+    def _client(self) -> OpenAI:
+        # Bounded by what is left of the request deadline; no retries that would outlive it
+        if remaining() is None:
+            return self.client.with_options(timeout=LLM_TIMEOUT)
+        return self.client.with_options(timeout=timeout_for(LLM_TIMEOUT), max_retries=0)
+
     def lookup_word(self, word: str, target_lang: str) -> Dict[str, Any]:
         prompt = DICTIONARY_PROMPT_TEMPLATE.format(target_lang=target_lang, word=word)
         try:
-            response = self.client.chat.completions.create(
+            response = self._client().chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0,
@@ -100,10 +170,60 @@ class OpenRouterService(LLMService):
             logger.error(f"OpenRouter lookup_word failed: {e}")
             raise e
 
+    def stream_lookup_word(self, word: str, target_lang: str) -> Iterator[str]:
+        prompt = DICTIONARY_PROMPT_TEMPLATE.format(target_lang=target_lang, word=word)
+        try:
+            stream = self._client().chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                stream=True,
+            )
+            # Hold output back while inside a <think> block
+            pending = ""
+            thinking = None
+            for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                pending += chunk.choices[0].delta.content
+                if thinking is None:
+                    stripped = pending.lstrip()
+                    if len(stripped) < len("<think>") and "<think>".startswith(stripped):
+                        continue
+                    thinking = stripped.startswith("<think>")
+                if thinking:
+                    end = pending.find("</think>")
+                    if end < 0:
+                        continue
+                    pending = pending[end + len("</think>"):]
+                    thinking = False
+                if pending:
+                    yield pending
+                    pending = ""
+        except Exception as e:
+            logger.error(f"OpenRouter stream_lookup_word failed: {e}")
+            raise e
+
+    def lookup_words(self, words: List[str], target_lang: str) -> Dict[str, Dict[str, Any]]:
+        prompt = BATCH_DICTIONARY_PROMPT_TEMPLATE.format(target_lang=target_lang, words="\n".join(words))
+        try:
+            response = self._client().chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+            )
+            text = response.choices[0].message.content.strip()
+            text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
+            text = re.sub(r"```json|```", "", text).strip()
+            return json.loads(text)
+        except Exception as e:
+            logger.error(f"OpenRouter lookup_words failed: {e}")
+            raise e
+
     def translate_sentence(self, sentence: str, target_lang: str) -> str:
         prompt = TRANSLATE_PROMPT_TEMPLATE.format(target_lang=target_lang, sentence=sentence)
         try:
-            response = self.client.chat.completions.create(
+            response = self._client().chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0,
@@ -141,6 +261,20 @@ class LLMManager:
             return self.services.get("gemini")
         return service
 
+    def provenance(self, name: str = None) -> Dict[str, str]:
+        """
+        Which provider, model and prompt version produce dictionary entries,
+        as stored on Word rows.
+        """
+        service_name = name or self.default_service_name
+        if service_name not in self.services:
+            service_name = "gemini"
+        return {
+            "provider": service_name,
+            "llm_model": getattr(self.services[service_name], "model", None) or "",
+            "prompt_version": DICTIONARY_PROMPT_VERSION,
+        }
+
 # Global instance
 llm_manager = LLMManager()
 
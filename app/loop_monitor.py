@@ -0,0 +1,107 @@
+"""
+Event Loop Monitor
+Measures how late the event loop wakes up a periodic sleeper. Lag means
+some callback held the loop (a blocking call inside an `async def`).
+
+With LOOP_MONITOR_DEBUG=1 a watchdog thread also logs the stack of the
+coroutine that is holding the loop once it is blocked past the threshold.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between lag measurements
+LOOP_MONITOR_INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL", "0.25"))
+# Lag above this is logged (and traced in debug mode)
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.1"))
+LOOP_MONITOR_DEBUG = os.environ.get("LOOP_MONITOR_DEBUG", "").lower() in ("1", "true", "yes")
+
+loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "Delay of the event loop in waking up a periodic timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Most recent event loop lag measurement")
+loop_blocked = metrics.counter("event_loop_blocked_total", "Times the event loop lagged past the threshold")
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD,
+                 debug: bool = LOOP_MONITOR_DEBUG):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        # Time the monitor task last ran, read by the watchdog thread
+        self._last_beat = time.monotonic()
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - expected, 0.0)
+            self._last_beat = time.monotonic()
+            loop_lag.observe(lag)
+            loop_lag_last.set(lag)
+            if lag > self.threshold:
+                loop_blocked.inc()
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        """
+        Runs in its own thread: while the loop is blocked, the monitor task
+        cannot beat, so whatever is on the loop thread's stack is the culprit.
+        """
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for <= self.threshold or beat == reported_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # Report each blocking episode once
+            reported_beat = beat
+            task = asyncio.current_task(self._loop)
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"Event loop blocked for over {blocked_for * 1000:.0f}ms "
+                           f"in task {task.get_name() if task else None} ({task.get_coro() if task else None}):\n{stack}")
+
+    async def start(self):
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._measure())
+        if self.debug:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logger.info(f"Event loop monitor started (interval {self.interval}s, threshold {self.threshold}s"
+                    f"{', tracing blocked coroutines' if self.debug else ''})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog:
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+
+# Global instance
+loop_monitor = LoopLagMonitor()
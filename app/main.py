@@ -12,7 +12,15 @@ logger = logging.getLogger("api.timing")
 
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import create_db_and_tables
-from app.api import words, settings, translate
+from app.ecdict_service import verify_database
+from app.cache import cache
+from app.deadline import DeadlineMiddleware
+from app.profiling import ProfilingMiddleware, profiling_enabled
+from app.loop_monitor import loop_monitor
+from app.retry_worker import retry_worker
+from app.refresh_service import version_refresher
+from app.suggest_service import suggest_index
+from app.api import words, settings, translate, subtitles, highlight, suggest, metrics
 import uvicorn
 
 app = FastAPI(
@@ -42,15 +50,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request time budget, read by every lookup tier
+app.add_middleware(DeadlineMiddleware)
+
+# Opt-in per-request profiling for admins (X-Profile header), added last so it wraps everything
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 @app.on_event("startup")
 def on_startup():
     # Initialize DB tables
     create_db_and_tables()
+    # Check the local ECDICT build before serving lookups from it
+    verify_database()
+
+@app.on_event("startup")
+async def start_suggest_index():
+    # Headword prefix index for /api/suggest, built in the background
+    await suggest_index.start()
+
+@app.on_event("startup")
+async def start_cache():
+    # Listen for invalidations from other workers
+    await cache.start()
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    # Surface blocking calls inside async handlers
+    await loop_monitor.start()
+
+@app.on_event("startup")
+async def start_retry_worker():
+    # Fill in words stored provisionally after failed lookups
+    await retry_worker.start()
+
+@app.on_event("startup")
+async def start_version_refresher():
+    # Re-fetch entries produced by an older provider, model or prompt
+    await version_refresher.start()
+
+@app.on_event("shutdown")
+async def stop_cache():
+    await cache.stop()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    await loop_monitor.stop()
+
+@app.on_event("shutdown")
+async def stop_retry_worker():
+    await retry_worker.stop()
+
+@app.on_event("shutdown")
+async def stop_version_refresher():
+    await version_refresher.stop()
 
 # Include Routers
 app.include_router(translate.router, prefix="/api")
 app.include_router(words.router, prefix="/api")
 app.include_router(settings.router, prefix="/api")
+app.include_router(subtitles.router, prefix="/api")
+app.include_router(highlight.router, prefix="/api")
+app.include_router(suggest.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 @app.get("/")
 def read_root():
@@ -2,21 +2,66 @@ from typing import Optional, List, Dict
 import uuid
 from datetime import datetime
 from sqlmodel import Field, SQLModel
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, JSON, Index
+from app.languages import DEFAULT_LANGUAGE
+from app.word_codec import CompactJSON
 
 class Word(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     original: str = Field(index=True)
+    # Language code of the translation ('zh', 'ja', ...); each language has its own row
+    target_lang: str = Field(default=DEFAULT_LANGUAGE)
     translation: str
     phonetic: Optional[str] = None
     audio_url: Optional[str] = None
-    meanings: List[Dict] = Field(default=[], sa_column=Column(JSON))
-    phonetics: List[Dict] = Field(default=[], sa_column=Column(JSON))
+    # Plain JSON, or binary with WORD_ENCODING=compact (see app/word_codec.py)
+    meanings: List[Dict] = Field(default=[], sa_column=Column(CompactJSON))
+    phonetics: List[Dict] = Field(default=[], sa_column=Column(CompactJSON))
     context: Optional[str] = None
     url: Optional[str] = None
     timestamp: float = Field(default_factory=lambda: datetime.now().timestamp())
     learned: bool = Field(default=False)
     star: bool = Field(default=False)
+    # Spaced repetition (SM-2): next review time, current interval and ease factor.
+    # Rows from before scheduling existed are backfilled as due since they were added.
+    due: float = Field(
+        default_factory=lambda: datetime.now().timestamp(),
+        sa_column_kwargs={"info": {"backfill_from": "timestamp"}}
+    )
+    interval_days: float = Field(default=0)
+    ease: float = Field(default=2.5)
+    reps: int = Field(default=0)
+    # Placeholder stored when every source failed; refreshed by the retry worker
+    provisional: bool = Field(default=False)
+    retry_count: int = Field(default=0)
+    retry_at: Optional[float] = None
+    # Provenance of LLM-generated entries; rows from an older setup are refreshed
+    provider: Optional[str] = None
+    llm_model: Optional[str] = None
+    prompt_version: Optional[str] = None
+    # Version refresh lease, or the next attempt after failed refreshes
+    refresh_at: Optional[float] = None
+    refresh_failures: int = Field(default=0)
+
+    __table_args__ = (
+        # Serves lookups of a word in one language
+        Index("ix_word_original_lang", "original", "target_lang"),
+        # Serves the review queue: starred, not learned, ordered by due time
+        Index("ix_word_review", "star", "learned", "due"),
+        # Serves the retry worker: provisional rows ordered by next attempt
+        Index("ix_word_retry", "provisional", "retry_at"),
+        # Serves the version refresh sweep
+        Index("ix_word_version", "provider", "llm_model", "prompt_version"),
+    )
+
+class WordStatsDay(SQLModel, table=True):
+    """
+    Starred words per day they were added (UTC), kept up to date by the
+    word mutations so /words/stats never scans the Word table.
+    """
+    day: str = Field(primary_key=True)
+    starred: int = Field(default=0)
+    learned: int = Field(default=0)
 
 class Settings(SQLModel, table=True):
     id: Optional[int] = Field(default=1, primary_key=True)
@@ -24,3 +69,10 @@ class Settings(SQLModel, table=True):
     highlight_enabled: bool = True
     immersion_mode: bool = False
     youtube_subtitles_enabled: bool = True
+
+class SubtitleTrack(SQLModel, table=True):
+    video_id: str = Field(primary_key=True)
+    target_lang: str = Field(default="zh", primary_key=True)
+    # Source subtitle line -> translated line
+    translations: Dict[str, str] = Field(default={}, sa_column=Column(JSON))
+    updated_at: float = Field(default_factory=lambda: datetime.now().timestamp())
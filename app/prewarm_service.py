@@ -0,0 +1,227 @@
+"""
+Cache Pre-warming
+Fills the Word table ahead of time with the most common ECDICT headwords,
+so first-time lookups for frequent words become cache hits.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
+from app.database import engine
+from app import ecdict_service
+from app.gemini_service import lookup_words, extract_simple_translation
+from app.languages import DEFAULT_LANGUAGE, normalize_language, language_name
+from app.llm_scheduler import llm_priority, BACKGROUND
+from app.llm_service import llm_manager
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.path.join(os.path.dirname(__file__), "..", "prewarm_state.json")
+
+# How each ECDICT ranking column is turned into an ordering.
+# bnc/frq are corpus ranks (1 = most common, 0 = unknown),
+# collins is 1-5 stars and oxford flags the Oxford 3000 core words.
+RANKINGS = {
+    "frq": ("frq > 0", "frq ASC"),
+    "bnc": ("bnc > 0", "bnc ASC"),
+    "collins": ("collins > 0", "collins DESC, frq ASC"),
+    "oxford": ("oxford > 0", "frq ASC"),
+}
+
+# Plain headwords only: no phrases, abbreviations with dots or numbers
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'-]*")
+
+MAX_FAILED_ATTEMPTS = 3
+
+
+def select_ranked_words(limit: int, rank_by: str = "frq", tag: Optional[str] = None) -> List[str]:
+    """
+    Return the top `limit` ECDICT headwords by the given ranking,
+    optionally restricted to an exam tag such as 'cet4' or 'ielts'.
+    """
+    if rank_by not in RANKINGS:
+        raise ValueError(f"Unknown ranking '{rank_by}', expected one of {', '.join(RANKINGS)}")
+    layout = ecdict_service.get_layout()
+    if not layout:
+        raise FileNotFoundError(f"ECDICT database not available at {ecdict_service.DB_PATH}")
+    # Built databases keep the ranking columns in 'entries', release copies in 'stardict'
+    table = "entries" if layout == "entries" else "stardict"
+
+    condition, order = RANKINGS[rank_by]
+    params = []
+    if tag:
+        # Tags are space separated, e.g. 'zk gk cet4 cet6 ky ielts'
+        condition += " AND (' ' || tag || ' ') LIKE ?"
+        params.append(f"% {tag.lower()} %")
+
+    conn = sqlite3.connect(ecdict_service.DB_PATH)
+    try:
+        cursor = conn.execute(
+            f"SELECT word FROM {table} WHERE {condition} ORDER BY {order}", params
+        )
+        words = []
+        seen = set()
+        for (word,) in cursor:
+            if not word or not WORD_PATTERN.fullmatch(word) or word in seen:
+                continue
+            seen.add(word)
+            words.append(word)
+            if len(words) >= limit:
+                break
+        return words
+    finally:
+        conn.close()
+
+
+def filter_cached_words(words: List[str], target_lang: str, chunk_size: int = 500) -> List[str]:
+    """
+    Drop words that already have a row in the Word table for `target_lang`.
+    """
+    existing: Set[str] = set()
+    with Session(engine) as session:
+        for i in range(0, len(words), chunk_size):
+            chunk = words[i:i + chunk_size]
+            statement = select(Word.original).where(Word.original.in_(chunk), Word.target_lang == target_lang)
+            existing.update(session.exec(statement).all())
+    return [word for word in words if word not in existing]
+
+
+def load_state(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {"failed": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_results(words: List[str], results: Dict[str, Dict], target_lang: str) -> List[str]:
+    """
+    Store batch results as unstarred Word rows.
+    Returns the words that got no usable result.
+    """
+    # Providers may echo keys in a different case
+    by_key = {key.lower(): value for key, value in results.items() if isinstance(value, dict)}
+    missing = []
+
+    with Session(engine) as session:
+        # Another worker (or a user lookup) may have cached some words meanwhile
+        statement = select(Word.original).where(Word.original.in_(words), Word.target_lang == target_lang)
+        existing = set(session.exec(statement).all())
+
+        for word in words:
+            if word in existing:
+                continue
+            data = by_key.get(word.lower())
+            if not data or not data.get("meanings"):
+                missing.append(word)
+                continue
+            session.add(Word(
+                original=word,
+                target_lang=target_lang,
+                translation=extract_simple_translation(data, word),
+                phonetic=data.get("phonetic"),
+                meanings=data.get("meanings", []),
+                phonetics=[],
+                audio_url=None,
+                learned=False,
+                star=False,
+                **llm_manager.provenance()
+            ))
+        session.commit()
+
+    return missing
+
+
+async def prewarm(
+    limit: int = 20000,
+    rank_by: str = "frq",
+    tag: Optional[str] = None,
+    batch_size: int = 20,
+    requests_per_minute: float = 30,
+    concurrency: int = 2,
+    target_lang: str = DEFAULT_LANGUAGE,
+    state_path: str = STATE_PATH,
+    retry_failed: bool = False,
+) -> Dict:
+    """
+    Warm the Word cache with the top `limit` ECDICT words.
+
+    Safe to interrupt: words already cached are skipped on the next run,
+    and words that repeatedly fail are remembered in `state_path`.
+    """
+    target_lang = normalize_language(target_lang)
+    state = load_state(state_path)
+    failed: Dict[str, int] = {} if retry_failed else state.get("failed", {})
+
+    ranked = await run_in_threadpool(select_ranked_words, limit, rank_by, tag)
+    pending = await run_in_threadpool(filter_cached_words, ranked, target_lang)
+    pending = [word for word in pending if failed.get(word, 0) < MAX_FAILED_ATTEMPTS]
+
+    total = len(pending)
+    logger.info(f"Pre-warm: {len(ranked)} ranked words, {len(ranked) - len(pending)} already cached or given up, {total} to fetch")
+    if not total:
+        return {"ranked": len(ranked), "fetched": 0, "failed": 0}
+
+    batches = [pending[i:i + batch_size] for i in range(0, total, batch_size)]
+    interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0
+    semaphore = asyncio.Semaphore(concurrency)
+    pace_lock = asyncio.Lock()
+    next_slot = time.monotonic()
+    progress = {"done": 0, "fetched": 0, "failed": 0}
+    started = time.monotonic()
+
+    async def wait_for_slot():
+        # Space out batch starts so the provider sees at most `requests_per_minute`
+        nonlocal next_slot
+        async with pace_lock:
+            now = time.monotonic()
+            delay = next_slot - now
+            next_slot = max(now, next_slot) + interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def run_batch(batch: List[str]):
+        async with semaphore:
+            await wait_for_slot()
+            try:
+                # Pre-warming yields to user traffic sharing this process
+                with llm_priority(BACKGROUND):
+                    results = await lookup_words(batch, language_name(target_lang))
+                missing = await run_in_threadpool(save_results, batch, results, target_lang)
+            except Exception as e:
+                logger.error(f"Pre-warm batch failed ({batch[0]}..): {e}")
+                missing = batch
+
+            for word in missing:
+                failed[word] = failed.get(word, 0) + 1
+            progress["done"] += len(batch)
+            progress["fetched"] += len(batch) - len(missing)
+            progress["failed"] += len(missing)
+
+            state["failed"] = failed
+            save_state(state_path, state)
+
+            elapsed = time.monotonic() - started
+            rate = progress["done"] / elapsed if elapsed > 0 else 0
+            eta = (total - progress["done"]) / rate if rate > 0 else 0
+            logger.info(
+                f"Pre-warm progress: {progress['done']}/{total} ({progress['done'] / total:.1%}), "
+                f"{progress['failed']} failed, {rate:.1f} words/s, ETA {eta:.0f}s"
+            )
+
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+    return {"ranked": len(ranked), "fetched": progress["fetched"], "failed": progress["failed"]}
@@ -0,0 +1,242 @@
+"""
+Request Profiling
+Runs a single request under a sampling profiler when an admin asks for it,
+by sending `X-Profile: <PROFILE_TOKEN>`. The token is only accepted in
+the header, so it never ends up in access logs or browser history.
+
+Each profiled request stores two artifacts in PROFILE_DIR:
+  <id>.folded  collapsed stacks, for flamegraph.pl or speedscope
+  <id>.json    timing breakdown
+and the response carries X-Profile-Id plus a Server-Timing header with
+the time the request ran on the event loop versus the time it awaited
+(I/O, thread pool, sleeps).
+
+Without PROFILE_TOKEN the middleware is not installed at all.
+"""
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "..", "profiles"))
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+
+# Innermost frames of threads that are waiting rather than working
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get")}
+
+# Profile of the request the current task belongs to; inherited by tasks it creates
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_TOKEN)
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the Python stacks of all other threads at a fixed interval
+    and counts them in collapsed ("folded") form.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        # Time this request's coroutines spent running on the event loop
+        self.on_loop = 0.0
+        self.wall = 0.0
+        self.process_cpu = 0.0
+
+    def summary(self, sampler: StackSampler) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "created": time.time(),
+            "wall_ms": round(self.wall * 1000, 3),
+            "on_loop_ms": round(self.on_loop * 1000, 3),
+            "awaited_ms": round(max(self.wall - self.on_loop, 0) * 1000, 3),
+            # Whole process, so includes thread pool work and any concurrent requests
+            "process_cpu_ms": round(self.process_cpu * 1000, 3),
+            "samples": sampler.samples,
+            "interval_ms": sampler.interval * 1000,
+        }
+
+
+@types.coroutine
+def _timed_steps(coro, profile: RequestProfile):
+    """
+    Drive `coro`, adding the duration of each step (send/throw until the
+    next suspension) to the profile's on-loop time.
+    """
+    value, error = None, None
+    while True:
+        started = time.perf_counter()
+        try:
+            if error is not None:
+                yielded = coro.throw(error)
+            else:
+                yielded = coro.send(value)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            profile.on_loop += time.perf_counter() - started
+        try:
+            value, error = (yield yielded), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value, error = None, e
+
+
+async def _timed(coro, profile: RequestProfile):
+    return await _timed_steps(coro, profile)
+
+
+class _TaskFactory:
+    """
+    Installed on the loop only while a profiled request is running, so tasks
+    spawned by that request (e.g. by call_next or gather) are timed too.
+    """
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.active = 0
+
+    def __call__(self, loop, coro, **kwargs):
+        profile = _current_profile.get()
+        if profile is not None:
+            coro = _timed(coro, profile)
+        if self.previous is not None:
+            return self.previous(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware; outermost, so the whole middleware stack is profiled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._factory: Optional[_TaskFactory] = None
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                # Constant-time, so response timing does not reveal the token
+                return hmac.compare_digest(value, PROFILE_TOKEN.encode("utf-8"))
+        return False
+
+    def _install_factory(self, loop):
+        if self._factory is None:
+            self._factory = _TaskFactory(loop.get_task_factory())
+            loop.set_task_factory(self._factory)
+        self._factory.active += 1
+
+    def _remove_factory(self, loop):
+        self._factory.active -= 1
+        if self._factory.active == 0:
+            loop.set_task_factory(self._factory.previous)
+            self._factory = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        # Headers are held back until the body is complete so they can carry the timings
+        messages: List[Dict] = []
+
+        async def buffered_send(message):
+            messages.append(message)
+
+        loop = asyncio.get_running_loop()
+        sampler = StackSampler(PROFILE_INTERVAL)
+        token = _current_profile.set(profile)
+        self._install_factory(loop)
+        started, cpu_started = time.perf_counter(), time.process_time()
+        sampler.start()
+        try:
+            await _timed(self.app(scope, receive, buffered_send), profile)
+        finally:
+            sampler.stop()
+            profile.wall = time.perf_counter() - started
+            profile.process_cpu = time.process_time() - cpu_started
+            self._remove_factory(loop)
+            _current_profile.reset(token)
+
+        summary = profile.summary(sampler)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{profile.id}.folded"), "w") as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(os.path.join(PROFILE_DIR, f"{profile.id}.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+        except OSError as e:
+            logger.error(f"Failed to store profile {profile.id}: {e}")
+        logger.info(f"Profiled {profile.method} {profile.path} as {profile.id}: "
+                    f"{summary['wall_ms']}ms wall, {summary['on_loop_ms']}ms on loop, "
+                    f"{summary['awaited_ms']}ms awaited, {sampler.samples} samples")
+
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode()),
+                    (b"server-timing", (
+                        f"total;dur={summary['wall_ms']}, loop;dur={summary['on_loop_ms']}, "
+                        f"awaited;dur={summary['awaited_ms']}, cpu;dur={summary['process_cpu_ms']}"
+                    ).encode()),
+                ]
+            await send(message)
@@ -2,6 +2,10 @@
 
 
 
+# Bump when DICTIONARY_PROMPT_TEMPLATE or BATCH_DICTIONARY_PROMPT_TEMPLATE changes
+# in a way that affects answers; older Word rows are then refreshed in the background
+DICTIONARY_PROMPT_VERSION = "1"
+
 DICTIONARY_PROMPT_TEMPLATE = """
 You are a professional English-{target_lang} dictionary.
 
@@ -29,6 +33,37 @@ Rules:
 Word: {word}
 """
 
+BATCH_DICTIONARY_PROMPT_TEMPLATE = """
+You are a professional English-{target_lang} dictionary.
+
+Return ONLY a valid JSON object with one entry per input word, in this exact format:
+
+{{
+  "<input word>": {{
+    "word": "",
+    "phonetic": "",
+    "meanings": [
+      {{
+        "partOfSpeech": "",
+        "definitions": ["", "", ""]
+      }}
+    ]
+  }}
+}}
+
+Rules:
+- Use each input word exactly as given as its key.
+- Only include parts of speech that exist.
+- Keep meanings short and accurate.
+- No explanations.
+- No markdown.
+- No comments.
+- The partOfSpeech should be abbreviation
+
+Words:
+{words}
+"""
+
 TRANSLATE_PROMPT_TEMPLATE = """
 Translate the following English sentence into natural {target_lang}.
 Return ONLY the {target_lang} translation.
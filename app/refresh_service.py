@@ -0,0 +1,282 @@
+"""
+Version Refresh
+Word rows record the provider, model and prompt version that produced them.
+Rows from an older setup keep being served (stale-while-revalidate) while
+this worker re-fetches them in the background under a request budget:
+words users actually hit first, then a sweep over all outdated rows.
+Rows are leased before they are fetched, so several workers share the
+sweep, and rows that fail back off exponentially (refresh_at).
+
+Rows without provenance (saved by the client, or from before provenance
+was recorded) are never overwritten. backfill_word_provenance.py marks
+them as LLM output explicitly when that is known to be true.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, select
+from app.cache import cache, word_cache_key
+from app.database import engine
+from app.gemini_service import lookup_words, extract_simple_translation
+from app.languages import language_name
+from app.llm_scheduler import llm_priority, BACKGROUND
+from app.llm_service import llm_manager
+from app.metrics import metrics
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+# LLM requests per minute the refresh may use (0 disables the background refresh)
+REFRESH_REQUESTS_PER_MINUTE = float(os.environ.get("REFRESH_REQUESTS_PER_MINUTE", "6"))
+REFRESH_BATCH_SIZE = int(os.environ.get("REFRESH_BATCH_SIZE", "10"))
+# How long to wait for on-demand words before re-checking when nothing is outdated
+REFRESH_IDLE_SECONDS = 300
+# Claimed rows are hidden from other workers for this long
+REFRESH_LEASE_SECONDS = 300
+# Rows that failed to refresh wait REFRESH_RETRY_DELAY * 2^(failures-1), capped
+REFRESH_RETRY_DELAY = float(os.environ.get("REFRESH_RETRY_DELAY", "3600"))
+REFRESH_MAX_RETRY_DELAY = float(os.environ.get("REFRESH_MAX_RETRY_DELAY", str(7 * 86400)))
+# Stale hits remembered per worker; older ones are left to the sweep
+REFRESH_DEMAND_MAX = 1000
+
+refresh_outdated = metrics.gauge("word_refresh_outdated", "Word rows produced by an older provider, model or prompt")
+refresh_progress = metrics.gauge("word_refresh_progress_ratio", "Share of Word rows produced by the current version")
+refresh_total = metrics.counter("word_refresh_total", "Background refreshes of outdated Word rows", ["result"])
+
+
+def version_tag(provider: Optional[str], llm_model: Optional[str], prompt_version: Optional[str]) -> Optional[str]:
+    if not provider:
+        return None
+    return f"{provider}/{llm_model}/{prompt_version}"
+
+
+def current_version_tag() -> str:
+    return version_tag(**llm_manager.provenance())
+
+
+def _outdated_condition():
+    # Only rows an LLM produced; rows without provenance may hold the user's own text
+    version = llm_manager.provenance()
+    return (Word.provisional == False) & (Word.provider != None) & or_(
+        Word.provider != version["provider"],
+        Word.llm_model != version["llm_model"],
+        Word.prompt_version != version["prompt_version"],
+    )
+
+
+def count_versions() -> Dict[str, int]:
+    with Session(engine) as session:
+        total = session.exec(
+            select(func.count()).select_from(Word).where(Word.provisional == False, Word.provider != None)
+        ).one()
+        outdated = session.exec(select(func.count()).select_from(Word).where(_outdated_condition())).one()
+    return {"total": total, "outdated": outdated}
+
+
+def next_refresh_at(failures: int) -> float:
+    """
+    When to try a row again after `failures` failed refreshes.
+    """
+    return time.time() + min(REFRESH_RETRY_DELAY * (2 ** (failures - 1)), REFRESH_MAX_RETRY_DELAY)
+
+
+def claim_outdated(limit: int, demand: List[Tuple[str, str]]) -> List[Tuple[uuid.UUID, str, str, int]]:
+    """
+    Lease outdated rows so workers don't refresh the same ones: rows of
+    the demanded (word, language) pairs first, then the sweep, starred first.
+    Rows in their lease or failure backoff are skipped.
+    """
+    now = time.time()
+    available = _outdated_condition() & or_(Word.refresh_at == None, Word.refresh_at <= now)
+    columns = (Word.id, Word.original, Word.target_lang, Word.refresh_failures, Word.refresh_at)
+    with Session(engine) as session:
+        rows = []
+        if demand:
+            pairs = or_(*((Word.original == word) & (Word.target_lang == lang) for word, lang in demand))
+            rows = session.exec(select(*columns).where(available, pairs).limit(limit)).all()
+        if len(rows) < limit:
+            seen = {row[0] for row in rows}
+            sweep = session.exec(
+                select(*columns).where(available)
+                .order_by(Word.star.desc(), Word.timestamp.desc())
+                .limit(limit)
+            ).all()
+            rows += [row for row in sweep if row[0] not in seen][:limit - len(rows)]
+
+        claimed = []
+        for word_id, original, target_lang, failures, refresh_at in rows:
+            # Only if no other worker claimed the row since it was read
+            unchanged = Word.refresh_at == None if refresh_at is None else Word.refresh_at == refresh_at
+            result = session.exec(
+                update(Word)
+                .where(Word.id == word_id, unchanged)
+                .values(refresh_at=now + REFRESH_LEASE_SECONDS)
+            )
+            if result.rowcount:
+                claimed.append((word_id, original, target_lang, failures))
+        session.commit()
+        return claimed
+
+
+def record_refresh_failures(rows: List[Tuple[uuid.UUID, int]]):
+    """
+    Back off rows the provider could not refresh; their lease becomes the next attempt time.
+    """
+    with Session(engine) as session:
+        for word_id, failures in rows:
+            session.exec(
+                update(Word).where(Word.id == word_id)
+                .values(refresh_failures=failures + 1, refresh_at=next_refresh_at(failures + 1))
+            )
+        session.commit()
+
+
+def apply_refresh(results: Dict[str, Dict], words: List[str], target_lang: str) -> List[str]:
+    """
+    Overwrite the generated fields of each word's rows in `target_lang`,
+    keeping star, learned and review state. Returns the words that were updated.
+    """
+    by_key = {key.lower(): value for key, value in results.items() if isinstance(value, dict)}
+    version = llm_manager.provenance()
+    updated = []
+    with Session(engine) as session:
+        rows = session.exec(select(Word).where(
+            Word.original.in_(words), Word.target_lang == target_lang, Word.provisional == False
+        )).all()
+        for word in rows:
+            data = by_key.get(word.original.lower())
+            if not data or not data.get("meanings"):
+                continue
+            word.translation = extract_simple_translation(data, word.original)
+            word.phonetic = data.get("phonetic")
+            word.meanings = data.get("meanings", [])
+            for field, value in version.items():
+                setattr(word, field, value)
+            word.refresh_at = None
+            word.refresh_failures = 0
+            session.add(word)
+            updated.append(word.original)
+        session.commit()
+    return updated
+
+
+class VersionRefresher:
+    def __init__(self, requests_per_minute: float = REFRESH_REQUESTS_PER_MINUTE,
+                 batch_size: int = REFRESH_BATCH_SIZE):
+        self.requests_per_minute = requests_per_minute
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        # (word, language) pairs served stale to users, refreshed ahead of the sweep
+        self._demand: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._wake: Optional[asyncio.Event] = None
+        self._total = 0
+        self._outdated = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0
+
+    def request(self, original: str, target_lang: str):
+        """
+        Ask for a word to be refreshed soon; called when a stale row is served.
+        """
+        if not self._task:
+            return
+        self._demand[(original, target_lang)] = None
+        if len(self._demand) > REFRESH_DEMAND_MAX:
+            self._demand.popitem(last=False)
+        self._wake.set()
+
+    def _update_progress(self):
+        refresh_outdated.set(self._outdated)
+        refresh_progress.set(1 - self._outdated / self._total if self._total else 1)
+
+    async def _recount(self):
+        counts = await run_in_threadpool(count_versions)
+        self._total, self._outdated = counts["total"], counts["outdated"]
+        self._update_progress()
+
+    async def _next_batch(self) -> List[Tuple[uuid.UUID, str, str, int]]:
+        demand = []
+        while self._demand and len(demand) < self.batch_size:
+            demand.append(self._demand.popitem(last=False)[0])
+        return await run_in_threadpool(claim_outdated, self.batch_size, demand)
+
+    async def run_once(self) -> int:
+        """
+        Refresh one batch; returns the number of words updated, or -1 if
+        there was nothing to do.
+        """
+        batch = await self._next_batch()
+        if not batch:
+            return -1
+        by_language: Dict[str, List[str]] = {}
+        for _, word, target_lang, _ in batch:
+            if word not in by_language.setdefault(target_lang, []):
+                by_language[target_lang].append(word)
+
+        updated = []
+        for target_lang, words in by_language.items():
+            try:
+                with llm_priority(BACKGROUND):
+                    results = await lookup_words(words, language_name(target_lang))
+            except Exception as e:
+                logger.error(f"Version refresh batch failed ({words[0]}.., {target_lang}): {e}")
+                results = {}
+            refreshed = await run_in_threadpool(apply_refresh, results, words, target_lang)
+            for word in refreshed:
+                await cache.invalidate(word_cache_key(word, target_lang))
+            updated.extend((word, target_lang) for word in refreshed)
+        failed = [(word_id, failures) for word_id, word, target_lang, failures in batch
+                  if (word, target_lang) not in updated]
+        if failed:
+            await run_in_threadpool(record_refresh_failures, failed)
+        refresh_total.inc(len(updated), result="refreshed")
+        refresh_total.inc(len(failed), result="failed")
+        self._outdated = max(self._outdated - len(updated), 0)
+        self._update_progress()
+        return len(updated)
+
+    async def _run(self):
+        interval = 60 / self.requests_per_minute
+        await self._recount()
+        if self._outdated:
+            logger.info(f"Version refresh: {self._outdated} of {self._total} words outdated, "
+                        f"now at {current_version_tag()}")
+        while True:
+            started = time.monotonic()
+            try:
+                done = await self.run_once()
+            except Exception as e:
+                logger.error(f"Version refresh failed: {e}")
+                done = 0
+            if done < 0:
+                # Nothing outdated: wait for stale hits, then check again
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), REFRESH_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    await self._recount()
+                continue
+            # Stay within the request budget
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    async def start(self):
+        if self.enabled and not self._task:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+# Global instance
+version_refresher = VersionRefresher()
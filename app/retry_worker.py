@@ -0,0 +1,151 @@
+"""
+Provisional Word Refresh
+Background worker that retries the lookup of provisional Word rows
+(stored by save_word when every source failed) with exponential backoff,
+replacing the placeholder once a real result comes back.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlmodel import Session, select
+from app.cache import cache, word_cache_key
+from app.database import engine
+from app.gemini_service import lookup_word, clear_miss, extract_simple_translation, LookupFailed
+from app.languages import language_name
+from app.llm_scheduler import llm_priority, BACKGROUND
+from app.llm_service import llm_manager
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+RETRY_POLL_SECONDS = float(os.environ.get("RETRY_POLL_SECONDS", "30"))
+RETRY_BATCH_SIZE = int(os.environ.get("RETRY_BATCH_SIZE", "10"))
+# Delay before attempt n is RETRY_BASE_DELAY * 2^n, capped at RETRY_MAX_DELAY
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "60"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", str(6 * 3600)))
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "8"))
+# Claimed rows are hidden from other workers for this long
+RETRY_LEASE_SECONDS = 300
+
+
+def next_retry_at(retry_count: int) -> Optional[float]:
+    """
+    When to try again after `retry_count` failed attempts; None to give up.
+    """
+    if retry_count >= RETRY_MAX_ATTEMPTS:
+        return None
+    return time.time() + min(RETRY_BASE_DELAY * (2 ** retry_count), RETRY_MAX_DELAY)
+
+
+def claim_due_words(limit: int) -> List[Tuple[uuid.UUID, str, str, int]]:
+    """
+    Pick provisional rows whose retry time has come and lease them,
+    so several workers don't retry the same word.
+    """
+    now = time.time()
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Word.id, Word.original, Word.target_lang, Word.retry_count, Word.retry_at)
+            .where(Word.provisional == True, Word.retry_at <= now)
+            .order_by(Word.retry_at)
+            .limit(limit)
+        ).all()
+        claimed = []
+        for word_id, original, target_lang, retry_count, retry_at in rows:
+            result = session.exec(
+                update(Word)
+                .where(Word.id == word_id, Word.retry_at == retry_at)
+                .values(retry_at=now + RETRY_LEASE_SECONDS)
+            )
+            if result.rowcount:
+                claimed.append((word_id, original, target_lang, retry_count))
+        session.commit()
+        return claimed
+
+
+def apply_result(word_id: uuid.UUID, data: Dict[str, Any]) -> Optional[Word]:
+    with Session(engine) as session:
+        word = session.get(Word, word_id)
+        if not word or not word.provisional:
+            return None
+        word.translation = extract_simple_translation(data, word.original)
+        word.phonetic = data.get("phonetic")
+        word.meanings = data.get("meanings", [])
+        word.provisional = False
+        word.retry_at = None
+        for field, value in llm_manager.provenance().items():
+            setattr(word, field, value)
+        session.add(word)
+        session.commit()
+        session.refresh(word)
+        return word
+
+
+def record_failure(word_id: uuid.UUID, retry_count: int):
+    with Session(engine) as session:
+        session.exec(
+            update(Word)
+            .where(Word.id == word_id)
+            .values(retry_count=retry_count + 1, retry_at=next_retry_at(retry_count + 1))
+        )
+        session.commit()
+
+
+class RetryWorker:
+    def __init__(self, poll_seconds: float = RETRY_POLL_SECONDS, batch_size: int = RETRY_BATCH_SIZE):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Tuple[int, int]:
+        """
+        Retry one batch of due words. Returns (refreshed, failed).
+        """
+        due = await run_in_threadpool(claim_due_words, self.batch_size)
+        refreshed = failed = 0
+        for word_id, original, target_lang, retry_count in due:
+            target_lang_name = language_name(target_lang)
+            try:
+                # The negative cache would just repeat the failure we are retrying
+                with llm_priority(BACKGROUND):
+                    data = await lookup_word(original, target_lang_name, skip_misses=True)
+            except LookupFailed as e:
+                failed += 1
+                await run_in_threadpool(record_failure, word_id, retry_count)
+                if retry_count + 1 >= RETRY_MAX_ATTEMPTS:
+                    logger.warning(f"Giving up on provisional word '{original}' after {retry_count + 1} attempts: {e.reason}")
+                continue
+
+            word = await run_in_threadpool(apply_result, word_id, data)
+            if word:
+                refreshed += 1
+                await clear_miss(original, target_lang_name)
+                await cache.invalidate(word_cache_key(original, target_lang))
+                logger.info(f"Refreshed provisional word '{original}' after {retry_count + 1} attempts")
+        return refreshed, failed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Provisional word retry failed: {e}")
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+# Global instance
+retry_worker = RetryWorker()
@@ -0,0 +1,105 @@
+"""
+Vocabulary Statistics
+Starred and learned counts are kept per day the word was added (UTC) in
+the WordStatsDay table. Every word mutation applies its delta in the same
+transaction, so reading the stats costs one row per day instead of a scan
+over all words. rebuild_word_stats.py recomputes the table from scratch.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.models import Word, WordStatsDay
+
+logger = logging.getLogger(__name__)
+
+# What a word contributes to the stats: (day, learned), or None when not starred
+WordState = Optional[Tuple[str, bool]]
+
+
+def day_of(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def word_state(word: Word) -> WordState:
+    if not word.star:
+        return None
+    return day_of(word.timestamp), bool(word.learned)
+
+
+def _deltas(changes: List[Tuple[WordState, WordState]]) -> Dict[str, List[int]]:
+    deltas: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            day, learned = state
+            deltas[day][0] += sign
+            deltas[day][1] += sign * learned
+    return {day: delta for day, delta in deltas.items() if delta != [0, 0]}
+
+
+def _upsert(session: Session, day: str, starred: int, learned: int):
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    table = WordStatsDay.__table__
+    statement = insert(table).values(day=day, starred=starred, learned=learned)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.day],
+        set_={"starred": table.c.starred + starred, "learned": table.c.learned + learned}
+    )
+    session.exec(statement)
+
+
+def record_changes(session: Session, changes: List[Tuple[WordState, WordState]]):
+    """
+    Apply the stats delta of words going from `before` to `after` state.
+    Runs inside the caller's transaction; commit together with the words.
+    """
+    for day, (starred, learned) in sorted(_deltas(changes).items()):
+        _upsert(session, day, starred, learned)
+
+
+def record_change(session: Session, before: WordState, after: WordState):
+    record_changes(session, [(before, after)])
+
+
+def get_stats(session: Session, start_day: Optional[str] = None, end_day: Optional[str] = None) -> Dict:
+    """
+    Totals over all days, plus the per-day rollups in [start_day, end_day].
+    """
+    rows = session.exec(select(WordStatsDay).order_by(WordStatsDay.day)).all()
+    days = [
+        {"date": row.day, "added": row.starred, "learned": row.learned}
+        for row in rows
+        if row.starred and (not start_day or row.day >= start_day) and (not end_day or row.day <= end_day)
+    ]
+    return {
+        "starred": sum(row.starred for row in rows),
+        "learned": sum(row.learned for row in rows),
+        "days": days,
+    }
+
+
+def rebuild_stats(session: Session) -> int:
+    """
+    Recompute every rollup from the Word table. Returns the number of days.
+    """
+    counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    rows = session.exec(
+        select(Word.timestamp, Word.learned).where(Word.star == True).execution_options(yield_per=1000)
+    )
+    for timestamp, learned in rows:
+        counts[day_of(timestamp)][0] += 1
+        counts[day_of(timestamp)][1] += bool(learned)
+
+    session.exec(delete(WordStatsDay))
+    for day, (starred, learned) in sorted(counts.items()):
+        session.add(WordStatsDay(day=day, starred=starred, learned=learned))
+    session.commit()
+    total = session.exec(select(func.coalesce(func.sum(WordStatsDay.starred), 0))).one()
+    logger.info(f"Rebuilt word stats: {total} starred words over {len(counts)} days")
+    return len(counts)
@@ -0,0 +1,313 @@
+"""
+Word Suggestions
+Prefix autocomplete over ECDICT headwords, ranked by corpus frequency,
+with the user's saved words boosted to the top.
+
+Headwords are one sorted sequence, so a prefix is a contiguous range
+found with two binary searches. With the compact image the sequence is
+the mmap'ed image itself, shared by all workers; each worker only keeps
+a 4-byte rank and a 1-byte spelling choice per key. Without the image
+the keys are read from SQLite into lists. Either way the index is built
+in a thread after startup, until then only saved words are suggested.
+
+Saved words are kept per worker like the highlight index: changes made
+by another worker arrive as a cache signal and trigger a reload.
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlmodel import Session, select
+from app import ecdict_service
+from app.cache import cache
+from app.models import Word
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the `limit` of a single request
+MAX_SUGGESTIONS = 20
+# Top suggestions of prefixes up to this length are computed at load time
+PRECOMPUTED_PREFIX_LEN = 3
+# Larger prefix ranges are ranked once and memoized
+MEMOIZE_RANGE_SIZE = 2000
+MEMOIZED_PREFIXES = 10000
+
+# Rank of headwords with neither a bnc nor a frq rank
+UNRANKED = 1 << 30
+# Order of image keys that are only inflected forms, never suggested
+EXCLUDED = 0xFFFFFFFF
+
+# Cache signal sent to the other workers when a saved word changed
+SUGGEST_SIGNAL = "suggest"
+
+
+def _rank(frq: Optional[int], bnc: Optional[int]) -> int:
+    # bnc/frq are corpus ranks, 1 = most common and 0 = unknown
+    ranks = [r for r in (frq, bnc) if r and r > 0]
+    return min(ranks) if ranks else UNRANKED
+
+
+class SuggestIndex:
+    """
+    Sorted ECDICT keys plus the user's starred words.
+
+    `_order[i]` is the position of headword i in global ranking order
+    (rank, then length, then alphabetical), so ranking any range only
+    compares integers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: Sequence[str] = []
+        # Spelling of each key: a list without the image, else the index into the record's entries
+        self._words: List[str] = []
+        self._spellings = array("B")
+        self._image: Optional[ecdict_service.DictionaryImage] = None
+        self._order = array("I")
+        self._top: Dict[str, array] = {}
+        self._memo: Dict[str, List[int]] = {}
+        # Saved words: sorted lowercase keys and key -> word id -> (original spelling, learned).
+        # Rows of several languages can share a key; the most recently synced one is shown.
+        self._user_keys: List[str] = []
+        self._user_words: Dict[str, Dict[uuid.UUID, Tuple[str, bool]]] = {}
+        self._user_loaded = False
+        self._loading: Optional[asyncio.Future] = None
+
+    async def start(self):
+        """
+        Build the headword index in the default executor, off the event loop.
+        """
+        self._loading = asyncio.get_running_loop().run_in_executor(None, self._load_logged)
+
+    def _load_logged(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Suggest index could not be built: {e}")
+
+    @staticmethod
+    def _read_image_ranks(conn: sqlite3.Connection, image: ecdict_service.DictionaryImage) -> Tuple[array, array]:
+        # Image keys and entries are both sorted by the UTF-8 key, walk them side by side
+        ranks = array("I", [EXCLUDED]) * len(image)
+        spellings = array("B", bytes(len(image)))
+        i, key_i, spelling = -1, None, 0
+        for key, frq, bnc in conn.execute("SELECT key, frq, bnc FROM entries ORDER BY key, word"):
+            if key != key_i:
+                i += 1
+                while i < len(image) and image[i] != key:
+                    i += 1
+                if i == len(image):
+                    raise ValueError(f"'{key}' is missing from the dictionary image, please rebuild it")
+                key_i, spelling = key, 0
+            else:
+                spelling += 1
+            # One suggestion per key ('polish'/'Polish'), using the more common spelling
+            rank = _rank(frq, bnc)
+            if rank < ranks[i] and spelling < 256:
+                ranks[i], spellings[i] = rank, spelling
+        return ranks, spellings
+
+    @staticmethod
+    def _read_keys(conn: sqlite3.Connection, layout: str) -> Tuple[List[str], List[str], array]:
+        if layout == "entries":
+            query = "SELECT key, word, frq, bnc FROM entries ORDER BY key"
+        else:
+            query = "SELECT lower(word), word, frq, bnc FROM stardict ORDER BY lower(word)"
+
+        keys, words, ranks = [], [], array("I")
+        for key, word, frq, bnc in conn.execute(query):
+            if not key:
+                continue
+            rank = _rank(frq, bnc)
+            # Share the string object when the spelling is the key itself
+            word = key if word == key else word
+            # One suggestion per key ('polish'/'Polish'), using the more common spelling
+            if keys and keys[-1] == key:
+                if rank < ranks[-1]:
+                    words[-1], ranks[-1] = word, rank
+                continue
+            keys.append(key)
+            words.append(word)
+            ranks.append(rank)
+        return keys, words, ranks
+
+    def load(self):
+        """
+        (Re)load headwords from the local ECDICT build.
+        """
+        t0 = time.time()
+        layout = ecdict_service.get_layout()
+        if not layout:
+            logger.warning("ECDICT not available, suggestions will only include saved words")
+            return
+
+        image = ecdict_service.get_image() if layout == "entries" else None
+        words: List[str] = []
+        spellings = array("B")
+        conn = sqlite3.connect(f"file:{ecdict_service.DB_PATH}?mode=ro", uri=True)
+        try:
+            if image:
+                keys: Sequence[str] = image
+                ranks, spellings = self._read_image_ranks(conn, image)
+            else:
+                keys, words, ranks = self._read_keys(conn, layout)
+        finally:
+            conn.close()
+
+        # Ties go to the shorter, then alphabetically first key (index order)
+        by_rank = sorted((i for i in range(len(ranks)) if ranks[i] != EXCLUDED),
+                         key=lambda i: (ranks[i], len(keys[i]), i))
+        order = array("I", [EXCLUDED]) * len(ranks)
+        for position, i in enumerate(by_rank):
+            order[i] = position
+
+        # Walking headwords best-first fills each short prefix's top list in order
+        top: Dict[str, array] = {}
+        for i in by_rank:
+            key = keys[i]
+            for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LEN) + 1):
+                entries = top.get(key[:length])
+                if entries is None:
+                    entries = top[key[:length]] = array("I")
+                if len(entries) < MAX_SUGGESTIONS:
+                    entries.append(i)
+        del by_rank
+
+        with self._lock:
+            self._keys, self._words, self._spellings, self._image = keys, words, spellings, image
+            self._order, self._top = order, top
+            self._memo = {}
+        logger.info(f"Suggest index built{' over the dictionary image' if image else ''}: "
+                    f"{len(order) - order.count(EXCLUDED)} headwords, {len(top)} precomputed prefixes "
+                    f"in {time.time() - t0:.2f}s")
+
+    def _word(self, i: int) -> str:
+        if self._image is None:
+            return self._words[i]
+        return self._image.record(i)["e"][self._spellings[i]][0]
+
+    def load_user_words(self, session: Session):
+        rows = session.exec(select(Word.id, Word.original, Word.learned).where(Word.star == True)).all()
+        with self._lock:
+            self._user_words = {}
+            for word_id, original, learned in rows:
+                key = original.strip().lower()
+                if key:
+                    self._user_words.setdefault(key, {})[word_id] = (original, learned)
+            self._user_keys = sorted(self._user_words)
+            self._user_loaded = True
+
+    def ensure_loaded(self, session: Session):
+        if not self._user_loaded:
+            self.load_user_words(session)
+
+    def invalidate_user_words(self):
+        """
+        Reload saved words on the next request, after another worker changed them.
+        """
+        with self._lock:
+            self._user_loaded = False
+
+    def sync_word(self, word: Word, previous_original: Optional[str] = None):
+        """
+        Reflect a changed Word row. No-op until saved words have been loaded.
+        """
+        cache.signal(SUGGEST_SIGNAL)
+        with self._lock:
+            if not self._user_loaded:
+                return
+            if previous_original and previous_original != word.original:
+                self._remove_user_word(word.id, previous_original)
+            if word.star:
+                self._add_user_word(word.id, word.original, word.learned)
+            else:
+                self._remove_user_word(word.id, word.original)
+
+    def _add_user_word(self, word_id: uuid.UUID, original: str, learned: bool):
+        key = original.strip().lower()
+        if not key:
+            return
+        rows = self._user_words.get(key)
+        if rows is None:
+            bisect.insort(self._user_keys, key)
+            rows = self._user_words[key] = {}
+        rows.pop(word_id, None)
+        rows[word_id] = (original, learned)
+
+    def _remove_user_word(self, word_id: uuid.UUID, original: str):
+        key = original.strip().lower()
+        rows = self._user_words.get(key)
+        if rows is None or rows.pop(word_id, None) is None or rows:
+            return
+        del self._user_words[key]
+        del self._user_keys[bisect.bisect_left(self._user_keys, key)]
+
+    @staticmethod
+    def _range(keys: Sequence[str], prefix: str) -> Tuple[int, int]:
+        lo = bisect.bisect_left(keys, prefix)
+        # Every key starting with the prefix sorts before prefix + U+10FFFF
+        hi = bisect.bisect_left(keys, prefix + "\U0010ffff", lo)
+        return lo, hi
+
+    def _top_headwords(self, prefix: str) -> Sequence[int]:
+        top = self._top.get(prefix)
+        if top is not None:
+            return top
+        if len(prefix) <= PRECOMPUTED_PREFIX_LEN:
+            # Short prefixes absent from the table have no headwords
+            return []
+
+        top = self._memo.get(prefix)
+        if top is not None:
+            return top
+        lo, hi = self._range(self._keys, prefix)
+        top = heapq.nsmallest(MAX_SUGGESTIONS, range(lo, hi), key=self._order.__getitem__)
+        top = [i for i in top if self._order[i] != EXCLUDED]
+        if hi - lo >= MEMOIZE_RANGE_SIZE and len(self._memo) < MEMOIZED_PREFIXES:
+            self._memo[prefix] = top
+        return top
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """
+        Up to `limit` completions of `prefix`: saved words first (those still
+        being learned before learned ones), then ECDICT headwords by frequency.
+        """
+        prefix = prefix.strip().lower()
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        if not prefix:
+            return []
+
+        with self._lock:
+            keys, order = self._keys, self._order
+
+            saved = []
+            lo, hi = self._range(self._user_keys, prefix)
+            for key in self._user_keys[lo:hi]:
+                original, learned = next(reversed(self._user_words[key].values()))
+                i = bisect.bisect_left(keys, key)
+                position = order[i] if i < len(keys) and keys[i] == key else UNRANKED
+                saved.append((learned, position, key, original))
+            saved.sort()
+
+            results = [{"word": original, "saved": True, "learned": learned}
+                       for learned, _, _, original in saved[:limit]]
+            seen = {key for _, _, key, _ in saved[:limit]}
+
+            for i in self._top_headwords(prefix):
+                if len(results) >= limit:
+                    break
+                if keys[i] not in seen:
+                    results.append({"word": self._word(i), "saved": False, "learned": False})
+
+        return results
+
+
+# Global instance, shared by all requests of this worker
+suggest_index = SuggestIndex()
+cache.on_signal(SUGGEST_SIGNAL, suggest_index.invalidate_user_words)
@@ -0,0 +1,162 @@
+"""
+Compact Word Encoding
+Optional binary encoding for the Word.meanings / Word.phonetics columns.
+
+WORD_ENCODING=json (default) keeps plain JSON columns. With
+WORD_ENCODING=compact the columns are binary and hold:
+  - msgpack with the repeated keys ('partOfSpeech', 'definitions', ...)
+    replaced by small integers (pip install msgpack),
+  - optionally zstd-compressed with a dictionary trained on our own rows
+    (pip install zstandard, WORD_ZSTD_DICT=path to the trained dictionary),
+  - or, without msgpack, JSON compressed by zlib with a preset dictionary.
+Plain JSON (text or bytes) is always accepted when reading, so rows can be
+converted in place with migrate_word_encoding.py.
+"""
+import json
+import logging
+import os
+import zlib
+from typing import Any, Optional
+from sqlalchemy import JSON, LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+WORD_ENCODING = os.environ.get("WORD_ENCODING", "json").lower()
+COMPACT_ENCODING = WORD_ENCODING == "compact"
+
+# Encoded values start with MAGIC (never the first byte of JSON) and a format byte
+MAGIC = b"\x00"
+FORMAT_MSGPACK = 1
+FORMAT_MSGPACK_ZSTD = 2
+FORMAT_JSON_ZLIB = 3
+
+# Keys interned as integers in msgpack payloads. Append only: the position is the code.
+INTERNED_KEYS = (
+    "partOfSpeech", "definitions", "definition", "example", "synonyms", "antonyms",
+    "text", "audio", "sourceUrl", "license", "name", "url",
+)
+_KEY_CODES = {key: code for code, key in enumerate(INTERNED_KEYS)}
+
+# Preset dictionary for the zlib fallback: the structure every row repeats
+ZLIB_DICTIONARY = json.dumps(
+    [{"partOfSpeech": "", "definitions": [{"definition": "", "example": "", "synonyms": [], "antonyms": []}]},
+     {"partOfSpeech": "n.", "definitions": ["", ""]}, {"partOfSpeech": "v.", "definitions": []},
+     {"partOfSpeech": "adj.", "definitions": []}, {"text": "", "audio": "", "sourceUrl": ""}],
+    ensure_ascii=False
+).encode("utf-8")
+
+
+def _intern(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {_KEY_CODES.get(k, k): _intern(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    return value
+
+
+def _expand(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {INTERNED_KEYS[k] if isinstance(k, int) else k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+class WordCodec:
+    def __init__(self, zstd_dict_path: Optional[str] = None):
+        self._compressor = None
+        self._decompressor = None
+        if zstandard is not None:
+            dictionary = None
+            if zstd_dict_path:
+                with open(zstd_dict_path, "rb") as f:
+                    dictionary = zstandard.ZstdCompressionDict(f.read())
+            self._compressor = zstandard.ZstdCompressor(level=10, dict_data=dictionary) if dictionary else None
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) if dictionary else zstandard.ZstdDecompressor()
+        elif zstd_dict_path:
+            logger.warning("WORD_ZSTD_DICT is set but zstandard is not installed, values are stored uncompressed")
+
+    @staticmethod
+    def pack(value: Any) -> Optional[bytes]:
+        """
+        Uncompressed msgpack with interned keys (also the zstd training sample format).
+        """
+        if msgpack is None:
+            return None
+        return msgpack.packb(_intern(value), use_bin_type=True)
+
+    def encode(self, value: Any) -> bytes:
+        packed = self.pack(value)
+        if packed is not None:
+            if self._compressor is not None:
+                compressed = self._compressor.compress(packed)
+                if len(compressed) < len(packed):
+                    return MAGIC + bytes([FORMAT_MSGPACK_ZSTD]) + compressed
+            return MAGIC + bytes([FORMAT_MSGPACK]) + packed
+
+        plain = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        compressor = zlib.compressobj(level=9, zdict=ZLIB_DICTIONARY)
+        compressed = compressor.compress(plain) + compressor.flush()
+        if len(compressed) + 2 < len(plain):
+            return MAGIC + bytes([FORMAT_JSON_ZLIB]) + compressed
+        return plain
+
+    def decode(self, data: Any) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        if isinstance(data, str):
+            return json.loads(data)
+        if not data.startswith(MAGIC):
+            return json.loads(data)
+
+        fmt, payload = data[1], data[2:]
+        if fmt == FORMAT_JSON_ZLIB:
+            decompressor = zlib.decompressobj(zdict=ZLIB_DICTIONARY)
+            return json.loads(decompressor.decompress(payload) + decompressor.flush())
+        if msgpack is None:
+            raise RuntimeError("Word data is msgpack-encoded but msgpack is not installed")
+        if fmt == FORMAT_MSGPACK_ZSTD:
+            if self._decompressor is None:
+                raise RuntimeError("Word data is zstd-compressed but zstandard is not installed")
+            payload = self._decompressor.decompress(payload)
+        elif fmt != FORMAT_MSGPACK:
+            raise ValueError(f"Unknown word encoding format {fmt}")
+        return _expand(msgpack.unpackb(payload, raw=False, strict_map_key=False))
+
+
+word_codec = WordCodec(os.environ.get("WORD_ZSTD_DICT"))
+
+
+class CompactJSON(TypeDecorator):
+    """
+    JSON column that is stored with word_codec when WORD_ENCODING=compact.
+    """
+    impl = JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if COMPACT_ENCODING:
+            return dialect.type_descriptor(LargeBinary())
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if COMPACT_ENCODING and value is not None:
+            return word_codec.encode(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        # JSON columns arrive decoded; binary ones (or JSON text in them) are decoded here
+        if isinstance(value, (bytes, memoryview, str)):
+            return word_codec.decode(value)
+        return value
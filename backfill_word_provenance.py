@@ -0,0 +1,58 @@
+"""
+Word Provenance Backfill Script
+Marks Word rows without provenance as produced by a given (older) LLM
+setup, so the background version refresh picks them up. Rows without
+provenance are otherwise left alone, since they may be client-saved or
+user-edited; only backfill rows known to be LLM output.
+
+Usage:
+    python backfill_word_provenance.py --provider openrouter --model deepseek/deepseek-r1 --before 1767225600
+    python backfill_word_provenance.py --provider gemini --unstarred-only --dry-run
+"""
+import argparse
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+from app.database import engine, create_db_and_tables
+from app.models import Word
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark Word rows without provenance as output of an older LLM setup")
+    parser.add_argument("--provider", required=True, help="Provider that produced the rows, e.g. openrouter, gemini")
+    parser.add_argument("--model", default="", help="Model that produced the rows")
+    parser.add_argument("--prompt-version", default="0", help="Prompt version of the rows (current prompts are newer)")
+    parser.add_argument("--before", type=float, help="Only rows saved before this Unix timestamp")
+    parser.add_argument("--unstarred-only", action="store_true", help="Skip starred rows, which users may have edited")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_db_and_tables()
+
+    conditions = [Word.provider == None, Word.provisional == False]
+    if args.before is not None:
+        conditions.append(Word.timestamp < args.before)
+    if args.unstarred_only:
+        conditions.append(Word.star == False)
+
+    with Session(engine) as session:
+        count = session.exec(select(func.count()).select_from(Word).where(*conditions)).one()
+        if args.dry_run:
+            print(f"{count} rows would be marked as {args.provider}/{args.model}/{args.prompt_version}")
+            return
+        session.exec(
+            update(Word).where(*conditions)
+            .values(provider=args.provider, llm_model=args.model, prompt_version=args.prompt_version)
+        )
+        session.commit()
+    print(f"Marked {count} rows as {args.provider}/{args.model}/{args.prompt_version}; "
+          f"the version refresh will re-fetch them")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,56 @@
 """
 ECDICT Integration Script
-Downloads ECDICT CSV and converts it to SQLite for fast local lookups.
+Builds the lookup-optimized SQLite database from the ECDICT CSV.
+
+Usage:
+    python download_ecdict.py                 # print download instructions
+    python download_ecdict.py build ecdict.csv [--out ecdict.db] [--version 1.0.28] [--image]
+    python download_ecdict.py image [--db ecdict.db] [--out ecdict.img]
 """
-import csv
-import sqlite3
-import urllib.request
-import os
+import argparse
+import logging
+
+from app.ecdict_builder import build_database, build_image
+from app.ecdict_service import DB_PATH, IMAGE_PATH
 
-# ECDICT CSV URL (using the stardict.csv from the repo)
-ECDICT_URL = "https://github.com/skywind3000/ECDICT/releases/download/1.0.28/ecdict-sqlite-28.zip"
-DB_PATH = "ecdict.db"
+# ECDICT CSV (the full release zip contains stardict.csv)
+ECDICT_URL = "https://github.com/skywind3000/ECDICT/releases/download/1.0.28/ecdict-stardict-28.zip"
 
 def download_ecdict():
-    """Download ECDICT database"""
-    print("Downloading ECDICT database...")
-    # For simplicity, we'll use the pre-built SQLite version
-    # User should manually download from: https://github.com/skywind3000/ECDICT/releases
-    print(f"Please download ecdict-sqlite-28.zip from:")
-    print("https://github.com/skywind3000/ECDICT/releases/download/1.0.28/ecdict-sqlite-28.zip")
-    print(f"Extract stardict.db and rename it to {DB_PATH}")
-    print("Place it in the service/ directory")
+    """Print where to get the ECDICT CSV"""
+    print("Please download ecdict-stardict-28.zip from:")
+    print(ECDICT_URL)
+    print("Extract stardict.csv, then build the lookup database with:")
+    print("    python download_ecdict.py build stardict.csv")
+
+def main():
+    parser = argparse.ArgumentParser(description="ECDICT database tools")
+    subparsers = parser.add_subparsers(dest="command")
+
+    build = subparsers.add_parser("build", help="Build the lookup database from the ECDICT CSV")
+    build.add_argument("csv_path", help="Path to stardict.csv / ecdict.csv")
+    build.add_argument("--out", default=DB_PATH, help="Output SQLite file")
+    build.add_argument("--version", help="ECDICT release version to record, e.g. 1.0.28")
+    build.add_argument("--image", action="store_true", help=f"Also write the compact image to {IMAGE_PATH}")
+
+    image = subparsers.add_parser("image", help="Write the compact mmap image from a built database")
+    image.add_argument("--db", default=DB_PATH, help="Built SQLite file")
+    image.add_argument("--out", default=IMAGE_PATH, help="Output image file")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        meta = build_database(args.csv_path, args.out, args.version)
+        print(f"Built {args.out} ({meta['entries']} entries, sha256 {meta['source_sha256']})")
+        if args.image:
+            count = build_image(args.out, IMAGE_PATH)
+            print(f"Built {IMAGE_PATH} ({count} keys)")
+    elif args.command == "image":
+        count = build_image(args.db, args.out)
+        print(f"Built {args.out} ({count} keys)")
+    else:
+        download_ecdict()
 
 if __name__ == "__main__":
-    download_ecdict()
+    main()
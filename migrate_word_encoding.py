@@ -0,0 +1,136 @@
+"""
+Word Encoding Migration Script
+Converts the Word.meanings / Word.phonetics columns between plain JSON and
+the compact encoding of app/word_codec.py, in batches.
+
+Usage:
+    python migrate_word_encoding.py --to compact [--train-dict word.zdict]
+    python migrate_word_encoding.py --to json
+
+Set WORD_ENCODING to the same value (and WORD_ZSTD_DICT to the trained
+dictionary) before restarting the service.
+"""
+import argparse
+import json
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import inspect, text
+from app.database import engine
+from app.word_codec import WordCodec, msgpack, zstandard
+
+logger = logging.getLogger("migrate_word_encoding")
+
+COLUMNS = ("meanings", "phonetics")
+
+
+def train_dictionary(path: str, size: int, samples: int = 20000):
+    """
+    Train a zstd dictionary on the msgpack form of existing rows.
+    """
+    if zstandard is None or msgpack is None:
+        raise RuntimeError("Training a dictionary needs msgpack and zstandard installed")
+    codec = WordCodec()
+    payloads = []
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT meanings, phonetics FROM word LIMIT {int(samples)}"))
+        for row in rows:
+            for value in row:
+                if value is not None:
+                    payloads.append(codec.pack(codec.decode(value) if isinstance(value, (str, bytes, memoryview)) else value))
+    dictionary = zstandard.train_dictionary(size, payloads)
+    with open(path, "wb") as f:
+        f.write(dictionary.as_bytes())
+    logger.info(f"Trained a {size} byte dictionary on {len(payloads)} values, saved to {path}")
+
+
+def alter_column_types(to: str):
+    """
+    Postgres needs the column type changed; SQLite stores either form as is.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    types = {column["name"]: str(column["type"]).lower() for column in inspect(engine).get_columns("word")}
+    with engine.begin() as conn:
+        for column in COLUMNS:
+            if to == "compact" and types[column] in ("json", "jsonb"):
+                conn.execute(text(f"ALTER TABLE word ALTER COLUMN {column} TYPE bytea "
+                                  f"USING convert_to({column}::text, 'UTF8')"))
+            elif to == "json" and types[column] == "bytea":
+                conn.execute(text(f"ALTER TABLE word ALTER COLUMN {column} TYPE json "
+                                  f"USING convert_from({column}, 'UTF8')::json"))
+            else:
+                continue
+            logger.info(f"Changed word.{column} to {'bytea' if to == 'compact' else 'json'}")
+
+
+def rewrite_rows(to: str, codec: WordCodec, batch_size: int):
+    before = after = rows_done = 0
+    last_id = None
+    binary = engine.dialect.name == "postgresql"
+    while True:
+        with engine.begin() as conn:
+            query = "SELECT id, meanings, phonetics FROM word"
+            if last_id is not None:
+                query += " WHERE id > :last_id"
+            rows = conn.execute(text(query + " ORDER BY id LIMIT :limit"),
+                                {"last_id": last_id, "limit": batch_size}).all()
+            if not rows:
+                break
+            for row in rows:
+                values = {}
+                for column, raw in zip(COLUMNS, row[1:]):
+                    if raw is None:
+                        values[column] = None
+                        continue
+                    value = codec.decode(raw) if isinstance(raw, (str, bytes, memoryview)) else raw
+                    before += len(raw) if isinstance(raw, (str, bytes, memoryview)) else len(json.dumps(raw))
+                    if to == "compact":
+                        encoded = codec.encode(value)
+                    else:
+                        encoded = json.dumps(value, ensure_ascii=False)
+                        # Still a bytea column on Postgres until alter_column_types runs
+                        encoded = encoded.encode("utf-8") if binary else encoded
+                    after += len(encoded)
+                    values[column] = encoded
+                conn.execute(text("UPDATE word SET meanings = :meanings, phonetics = :phonetics WHERE id = :id"),
+                             {**values, "id": row[0]})
+            last_id = rows[-1][0]
+            rows_done += len(rows)
+        logger.info(f"Converted {rows_done} rows")
+    return rows_done, before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Word meanings/phonetics between JSON and compact encoding")
+    parser.add_argument("--to", choices=["compact", "json"], required=True, help="Target encoding")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per transaction")
+    parser.add_argument("--train-dict", help="Train a zstd dictionary on existing rows, save it here and use it")
+    parser.add_argument("--dict-size", type=int, default=16384, help="Size of the trained dictionary in bytes")
+    parser.add_argument("--dict", help="Existing zstd dictionary to compress with")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    dict_path = args.dict
+    if args.to == "compact":
+        if msgpack is None:
+            logger.warning("msgpack is not installed, falling back to zlib-compressed JSON")
+        if args.train_dict:
+            train_dictionary(args.train_dict, args.dict_size)
+            dict_path = args.train_dict
+        alter_column_types("compact")
+
+    rows, before, after = rewrite_rows(args.to, WordCodec(dict_path), args.batch_size)
+
+    if args.to == "json":
+        alter_column_types("json")
+
+    print(f"Converted {rows} rows: {before} -> {after} bytes")
+    print(f"Now set WORD_ENCODING={args.to}" + (f" and WORD_ZSTD_DICT={dict_path}" if dict_path else ""))
+
+
+if __name__ == "__main__":
+    main()
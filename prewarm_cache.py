@@ -0,0 +1,52 @@
+"""
+Cache Pre-warming Script
+Fetches the most common ECDICT words through the LLM ahead of time
+and stores them in the Word table.
+
+Usage:
+    python prewarm_cache.py --limit 20000
+    python prewarm_cache.py --tag cet4 --limit 5000 --rpm 20
+"""
+import argparse
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database import create_db_and_tables
+from app.prewarm_service import prewarm, RANKINGS, STATE_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the word cache from ECDICT frequency rankings")
+    parser.add_argument("--limit", type=int, default=20000, help="Number of top-ranked words to cover")
+    parser.add_argument("--rank-by", choices=list(RANKINGS), default="frq", help="ECDICT ranking column")
+    parser.add_argument("--tag", help="Restrict to an ECDICT tag, e.g. cet4, cet6, ielts, toefl")
+    parser.add_argument("--batch-size", type=int, default=20, help="Words per LLM request")
+    parser.add_argument("--rpm", type=float, default=30, help="Maximum LLM requests per minute")
+    parser.add_argument("--concurrency", type=int, default=2, help="LLM requests in flight")
+    parser.add_argument("--target-lang", default="zh", help="Target language code, e.g. zh, ja, ko")
+    parser.add_argument("--state", default=STATE_PATH, help="Resume state file")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry words that failed on earlier runs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_db_and_tables()
+
+    summary = asyncio.run(prewarm(
+        limit=args.limit,
+        rank_by=args.rank_by,
+        tag=args.tag,
+        batch_size=args.batch_size,
+        requests_per_minute=args.rpm,
+        concurrency=args.concurrency,
+        target_lang=args.target_lang,
+        state_path=args.state,
+        retry_failed=args.retry_failed,
+    ))
+    print(f"Done: {summary['fetched']} words cached, {summary['failed']} failed (out of {summary['ranked']} ranked)")
+
+
+if __name__ == "__main__":
+    main()
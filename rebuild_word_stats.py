@@ -0,0 +1,31 @@
+"""
+Word Stats Rebuild Script
+Recomputes the daily vocabulary rollups behind GET /api/words/stats from
+the Word table, e.g. to backfill an existing database or after editing
+rows by hand.
+
+Usage:
+    python rebuild_word_stats.py
+"""
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlmodel import Session
+from app.database import engine, create_db_and_tables
+from app.stats_service import rebuild_stats, get_stats
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    create_db_and_tables()
+
+    with Session(engine) as session:
+        days = rebuild_stats(session)
+        stats = get_stats(session)
+    print(f"Rebuilt {days} days: {stats['starred']} starred, {stats['learned']} learned")
+
+
+if __name__ == "__main__":
+    main()